@@ -0,0 +1,72 @@
+"""
+Throughput of the terminal receive path: bytes from the serial reader to the
+str fed to pyte. Compares the old per-byte chr() join with the incremental
+UTF-8 decoder TerminalWindow uses now, on recorded captures:
+
+    python benchmarks/terminal_decode.py capture1.bin capture2.bin ...
+
+Without arguments a synthetic capture is used (sensor lines, a traceback,
+some non-ASCII output). Each capture is cut into reads of a few typical
+sizes; "mangled" counts the characters in the result that decoding the
+whole capture at once doesn't produce (Latin-1 mojibake, replacement
+characters for UTF-8 sequences split by a read boundary).
+"""
+import codecs
+import sys
+import time
+
+READ_SIZES = (1, 64, 4096)
+
+
+def old_path(chunks):
+    out = []
+    for data in chunks:
+        out.append("".join(chr(element) if isinstance(element, int) else element for element in data))
+    return "".join(out)
+
+
+def incremental(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    return "".join([decoder.decode(data) for data in chunks])
+
+
+def synthetic():
+    lines = []
+    for i in range(20000):
+        lines.append(f"t={i * 0.01:.2f} temp={20 + i % 7 * 0.13:.2f}°C hum={40 + i % 11}%\r\n")
+        if i % 500 == 0:
+            lines.append('Traceback (most recent call last):\r\n  File "main.py", line 12\r\nOSError: [Errno 19] ENODEV\r\n')
+        if i % 97 == 0:
+            lines.append("status ✓ ok — Grüße 温度\r\n")
+    return "".join(lines).encode("utf-8")
+
+
+def mangled(text, reference):
+    expected = set(reference)
+    return sum(1 for c in text if c not in expected)
+
+
+def run(name, capture):
+    reference = capture.decode("utf-8", "replace")
+    print(f"{name}: {len(capture) / 1024:.0f} KB")
+    for size in READ_SIZES:
+        view = memoryview(capture)
+        chunks = [view[i:i + size] for i in range(0, len(capture), size)]
+        for label, fn in (("chr join", old_path), ("incremental", incremental)):
+            start = time.perf_counter()
+            text = fn(chunks)
+            elapsed = time.perf_counter() - start
+            print(f"  reads of {size:5d} B  {label:12s} {len(capture) / elapsed / 1e6:8.2f} MB/s  "
+                  f"mangled {mangled(text, reference)}")
+
+
+def main(paths):
+    if not paths:
+        run("synthetic", synthetic())
+    for path in paths:
+        with open(path, "rb") as f:
+            run(path, f.read())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+
+from . import jobs
+from . import mypyboard
+
+
+class AutoSync:
+    """
+    Uploads saved files in the background.
+
+    Saves are debounced: a batch starts `delay` seconds after the last save, and
+    all files saved until then go up in one raw REPL session, as one job on the
+    device job executor. Files saved while a batch is uploading are queued and
+    go up in the next batch, never in a second transfer running alongside.
+
+    Files below the project folder (project_folder returns it, or None) keep
+    their path relative to it on the board, like a project sync. A batch that
+    fails is queued again and retried with a growing delay, up to max_backoff.
+    """
+
+    max_backoff = 30.0
+
+    def __init__(self, delay=0.5, status_callback=None, progress_callback=None, project_folder=None):
+        self.delay = delay
+        self.status_callback = status_callback
+        self.progress_callback = progress_callback
+        self.project_folder = project_folder
+
+        self._lock = threading.Lock()
+        self._pending = {}  # path -> None, keeps save order
+        self._last_save = 0.0
+        self._timer = None
+        self._busy = False
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def _status(self, msg):
+        if self.status_callback is not None:
+            try:
+                self.status_callback(msg)
+            except Exception:
+                pass
+
+    def file_saved(self, path):
+        with self._lock:
+            self._pending.pop(path, None)
+            self._pending[path] = None
+            self._last_save = time.time()
+            if self._busy:
+                # The running batch schedules the next one when done.
+                return
+            # After a failure a save doesn't cut the backoff short.
+            self._schedule(max(self.delay, self._retry_at - time.time()))
+
+    def pending(self):
+        with self._lock:
+            return list(self._pending)
+
+    def _schedule(self, delay):
+        # with self._lock held
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(0.0, delay), self._start)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _start(self):
+        with self._lock:
+            self._timer = None
+            if self._busy or not self._pending:
+                return
+            wait = max(self._last_save + self.delay, self._retry_at) - time.time()
+            if wait > 0:
+                # Saved again meanwhile: keep debouncing.
+                self._schedule(wait)
+                return
+            batch = list(self._pending)
+            self._pending.clear()
+            self._busy = True
+
+        jobs.DeviceJobExecutor.for_port().submit(
+            "sync_files", [(path, self._remote(path)) for path in batch],
+            on_progress=self.progress_callback,
+            on_done=lambda f, b=batch: self._batch_done(f, b),
+            description="Autosync",
+        )
+
+    def _remote(self, path):
+        # Path on the board below the working directory; None uploads under the file name.
+        folder = self.project_folder() if self.project_folder is not None else None
+        if not folder:
+            return None
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(folder))
+        if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            return None
+        return rel.replace(os.sep, "/")
+
+    def _batch_done(self, future, batch):
+        failed = (not future.cancelled() and future.exception() is not None
+                  and not isinstance(future.exception(), mypyboard.PyboardCancelled))
+        if not future.cancelled() and future.exception() is None:
+            self._status(f"Autosync: {future.result()} of {len(batch)} file(s) uploaded")
+        with self._lock:
+            self._busy = False
+            if failed:
+                # Nothing is lost: the batch goes up again with what was saved meanwhile.
+                pending = dict.fromkeys(batch)
+                pending.update(self._pending)
+                self._pending = pending
+                self._failures += 1
+                backoff = min(self.delay * 2 ** self._failures, self.max_backoff)
+                self._retry_at = time.time() + backoff
+            else:
+                self._failures = 0
+                self._retry_at = 0.0
+            if self._pending:
+                self._schedule(max(self._last_save + self.delay, self._retry_at) - time.time())
+        if failed:
+            self._status(f"Autosync: upload failed, retrying in {backoff:.1f}s")
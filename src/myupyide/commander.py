@@ -1,9 +1,12 @@
 ﻿from ast import Delete
+import os
 import tkinter as tk
 from tkinter import messagebox, filedialog
 from turtle import delay
 from . import share_serial
 from . import sync
+from . import settings
+from . import jobs
 
 class CustomTooltip:
     def __init__(self, widget, text, delay):
@@ -70,7 +73,6 @@ class RemoteCommander:
         self.viewer = tk.Text(self.split_frame)
         self.split_frame.add(self.viewer)
 
-        self.sync = sync.SyncModule()
         #self.sharedserial=share_serial.SerialPortManager()
 
         #self.master.bind("<FocusIn>", self.refresh_filelist)
@@ -90,6 +92,8 @@ class RemoteCommander:
             ("-", "-", None, ""),
             ("Download", "📥", self.download, "**"),
             ("Upload", "📤", self.upload, ""),
+            ("Diff with Project", "⇄", self.diff, ""),
+            ("Resume Transfers", "⏯", self.resume_transfers, ""),
             ("-", "-", None, ""),
             ("Rename", "🖊️", self.rename, "*"),
             ("Delete File", "\U0001F5D1\U0001F4C4", self.delete_file, "**"),
@@ -128,10 +132,20 @@ class RemoteCommander:
         self.remotefiles.bind("<Button-3>", self.show_context_menu)
         self.remotefiles.bind("<<ListboxSelect>>", self.update_selection_dependent_controls)
 
+    def jobs(self):
+        # Device operations run on the port's worker thread; callbacks come back on the Tk thread.
+        return jobs.DeviceJobExecutor.for_port()
+
+    def _result(self, future):
+        # Result of a finished job, or None if it failed (the failure is on the status bar already)
+        if future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+
     def set_cwd (self):
         self.workdir = self.workdirentry.get ()
         sync.SyncModule.workdir = self.workdir
-        self.sync.sync_action('chdir', self.workdir)
+        self.jobs().submit("action", 'chdir', self.workdir)
         print (self.workdir)
 
     def update_selection_dependent_controls(self, event=None):
@@ -156,17 +170,33 @@ class RemoteCommander:
 
 
     # Placeholder methods for the actions
-    def refresh_filelist(self, event=None):
+    def refresh_filelist(self, event=None, priority=None):
+        # priority: that of the job the refresh follows, so it can't overtake (and
+        # preempt) it; default "call", which may run while a transfer pauses.
+        workdir = self.workdir
+
+        def list_files(s):
+            # pwd and dir in one job, so they share the session
+            cwd = workdir
+            if cwd == "":
+                cwd = s.sync_action('pwd').decode().strip(" \r\n")
+            return cwd, s.sync_action('dir', cwd)
+
+        self.jobs().submit("call", list_files, on_done=self._show_filelist, description="Refresh", priority=priority)
+        print("Refreshing file list...")
+
+    def _show_filelist(self, future):
+        result = self._result(future)
+        if result is None:
+            return
+        cwd, files = result
         if self.workdir == "":
-            self.workdir = self.sync.sync_action('pwd').decode().strip(" \r\n")
+            self.workdir = cwd
             self.workdirentry.delete(0, tk.END)
             self.workdirentry.insert(0, self.workdir)
-        #        
-        files=self.sync.sync_action('dir', self.workdir)
         self.remotefiles.delete(0, tk.END)
         for file in files:
             self.remotefiles.insert(tk.END, file.name+" ("+str(file.st_size)+")")
-        print("Refreshing file list...")
 
     def preview(self):
         filenames = self.get_selected_filenames()
@@ -196,12 +226,45 @@ class RemoteCommander:
 
     def upload(self):
         filepaths = filedialog.askopenfilenames()
-        for filepath in filepaths:
-            filename = os.path.basename(filepath)
-            self.uploadfiletoremote(filepath, filename)
-        self.refresh_filelist()
+        filenames = [os.path.basename(filepath) for filepath in filepaths]
+        self.uploadfiletoremote(filepaths, filenames)
+        self.refresh_filelist(priority=jobs.DEFAULT_PRIORITY["upload"])
+
+
 
+    def diff(self):
+        folder = settings.Settings().get_setting("project")
+        if not folder:
+            messagebox.showinfo("No Project", "Open a project folder first.")
+            return
+        marks = {"new": "+", "changed": "M", "same": "=", "remote": "-"}
+
+        def show(future):
+            result = self._result(future)
+            if result is None:
+                return
+            self.viewer.delete('1.0', tk.END)
+            self.viewer.insert(tk.END, f"{folder} <-> {self.workdir or '(cwd)'}\n")
+            self.viewer.insert(tk.END, "+ new  M changed  = same  - only on board\n\n")
+            for state, name in result:
+                self.viewer.insert(tk.END, f"{marks.get(state, '?')} {name}\n")
+
+        self.jobs().submit("call", lambda s: s.remote_diff(folder), on_done=show, description="Diff")
+
+
+
+    def resume_transfers(self):
+        # Uploads/downloads that broke off (cable, reset) continue where they stopped
+        def show(future):
+            done = self._result(future)
+            if done is None:
+                return
+            self.viewer.insert(tk.END, f"Resumed {len(done)} transfer(s)\n")
+            for remote in done:
+                self.viewer.insert(tk.END, f"  {remote}\n")
+            self.refresh_filelist()
 
+        self.jobs().submit("resume", on_done=show, description="Resume transfers")
 
     def rename(self):
         filenames = self.get_selected_filenames()
@@ -339,56 +402,66 @@ class RemoteCommander:
 
 
     # Define your remote operations here, using filename or filenames as parameter(s)
+    # They queue jobs on the device worker; jobs of the same priority class run in
+    # order, so a refresh queued after them at their class sees their result.
     def remotecopy (self, src, dst):
-        self.sync.sync_action('cp', src, dst)
+        self.jobs().submit("action", 'cp', src, dst)
 
     def remotemkdir (self, dirname):
-        self.sync.sync_action('mkdir', dirname)
+        self.jobs().submit("action", 'mkdir', dirname)
 
     def remotecd (self, dirname):
-        self.sync.sync_action('cd', dirname)
+        self.jobs().submit("action", 'cd', dirname)
 
     def downloadremotefile(self, remote_filename, local_filename):
         print(f"Downloading file {remote_filename} to {local_filename}...")
-        self.sync.sync_action('get', remote_filename, local_filename)
+        self.jobs().submit("download", remote_filename, local_filename)
 
     def uploadfiletoremote(self, local_filenames, remote_filenames):
         for local_filename, remote_filename in zip(local_filenames, remote_filenames):
             print(f"Uploading file {local_filename} as {remote_filename} on remote...")
-            self.sync.sync_action('put', local_filename, remote_filename)
+            self.jobs().submit("upload", local_filename, remote_filename)
 
     def remotefile_rename(self, old_filename, new_filename):
         print(f"Renaming file {old_filename} to {new_filename}...")
-        self.sync.sync_action('mv', old_filename, new_filename)
+        self.jobs().submit("action", 'mv', old_filename, new_filename)
 
 
     def remotefile_delete(self, filename):
         print(f"Deleting file {filename}...")
-        self.sync.sync_action('rm', filename)
+        self.jobs().submit("action", 'rm', filename)
 
     def remotefile_touch(self, filename):
         print(f"Touching file {filename}...")
-        self.sync.sync_action('touch', filename)
+        self.jobs().submit("action", 'touch', filename)
 
     def remotefile_rmdir(self, dirname):
         print(f"Removing directory {dirname}...")
-        self.sync.sync_action('rmdir', dirname)
+        self.jobs().submit("action", 'rmdir', dirname)
 
     def remoterunfile(self, filename):
         print(f"Running file {filename}...")
-        self.sync.sync_action('run', filename)
+        self.jobs().submit("action", 'run', filename)
 
-    def remoteremotepreview(self, filename):
-        print(f"Previewing file {filename}...")
-        self.sync.sync_action('cat', filename)
+    def remotefile_stat(self, filename):
+        def show(future):
+            result = self._result(future)
+            if result is not None:
+                self.viewer.insert(tk.END, f"{filename}: {result}\n")
+        self.jobs().submit("stat", filename, on_done=show)
 
 
 
     # Define your remote operation here, using item as parameter
     def remotepreview(self, item):
-        text = self.sync.sync_action('cat', item)
-        self.viewer.delete('1.0', tk.END)
-        self.viewer.insert(tk.END, text)
+        def show(future):
+            data = self._result(future)
+            if data is None:
+                return
+            self.viewer.delete('1.0', tk.END)
+            self.viewer.insert(tk.END, bytes(data).decode(errors="replace"))
+        self.jobs().submit("action", 'view', item, on_done=show, description="Preview",
+                          priority=jobs.INTERACTIVE)
 
 
 
@@ -23,6 +23,10 @@ class SourceEditor:
         # Keep track of opened files: {tab: {'path': path, 'content': content, 'changed': False}}
         self.opened_files = {}
         self.settings = settings.Settings()
+        self.project_folder = None
+
+        # Called with the file path after every save (autosync hooks in here)
+        self.save_callbacks = []
 
         self.courier = font.Font(family="Courier New", size=12)
 
@@ -485,6 +489,12 @@ class SourceEditor:
         self.opened_files[tab]["changed"] = False
         self._update_tab_title(tab, file_path)
 
+        for callback in list(self.save_callbacks):
+            try:
+                callback(file_path)
+            except Exception as e:
+                print("Save callback failed:", e)
+
     def save_all_files(self):
         for tab in list(self.opened_files.keys()):
             if self.opened_files[tab]["changed"]:
@@ -505,6 +515,7 @@ class SourceEditor:
             file_list = [f for f in file_list if f.endswith((".py", ".txt"))]
             for filename in file_list:
                 self._create_tab(os.path.join(folder_path, filename))
+            self.project_folder = folder_path
             self.settings.set_setting("project", folder_path)
 
     def load_folder_from_settings(self):
@@ -0,0 +1,335 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from . import journal
+from . import mypyboard
+from . import share_serial
+from . import sync
+
+
+# Priority classes, lower runs first
+INTERACTIVE = 0
+NORMAL = 1
+BULK = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BULK: "bulk"}
+
+# Priority of a job kind unless submit() is told otherwise
+DEFAULT_PRIORITY = {
+    "sync": NORMAL,
+    "sync_files": BULK,
+    "sync_project": BULK,
+    "upload": BULK,
+    "download": BULK,
+    "exec": NORMAL,
+    "list": INTERACTIVE,
+    "stat": INTERACTIVE,
+    "action": NORMAL,
+    "call": NORMAL,
+    "resume": BULK,
+}
+
+
+class DeviceJobExecutor:
+    """
+    Runs device operations on a worker thread, one worker per serial port, so
+    the Tk main loop never waits for the board.
+
+    submit() queues a job and returns a concurrent.futures.Future. Progress and
+    completion callbacks are handed back to the Tk thread through a queue that
+    is polled with after(), see attach_tk(). Without Tk they run on the worker.
+
+    Job kinds:
+        sync          (path)                  sync_file, skips unchanged files
+        sync_files    (files)                 [(path, remote or None)], several sync_file in one session,
+                                              returns number uploaded
+        sync_project  (folder)                SyncModule.sync_project
+        upload        (local, remote)         unconditional upload
+        download      (remote, local)
+        exec          (code)                  returns the output as str
+        list          (remote_dir)            fs_listdir entries
+        stat          (remote_path)
+        action        (action, src, dest)     any SyncModule.sync_action
+        call          (fn)                    fn(sync_module), for grouped operations
+        resume        ()                      finish broken off transfers, see journal.py
+
+    Jobs run by priority class (INTERACTIVE, NORMAL, BULK), first come first
+    served within a class. A running transfer yields at its chunk boundaries
+    when a job of a higher class is waiting: the transfer is paused, the waiting
+    jobs run on the same raw REPL session, then the transfer resumes. stats()
+    shows queue depth and wait times per class.
+
+    cancel() stops a job: a queued one doesn't run, a running one stops at the
+    next chunk boundary with the partial file removed (PyboardCancelled).
+    Ctrl-C typed in the terminal while a job holds the port cancels the jobs
+    instead of racing them, see SerialPortManager.set_interrupt_callback().
+    """
+
+    _executors = {}
+    _executors_lock = threading.Lock()
+
+    # Callbacks waiting to run on the Tk thread
+    _ui_queue = queue.Queue()
+    _tk_widget = None
+    poll_interval_ms = 30
+
+    _status_cb: Optional[Callable[[str], None]] = None
+
+    def __init__(self, port_name=None):
+        self.port_name = port_name
+        self.sync = sync.SyncModule(self._on_progress)
+        self.sync.scheduler = self
+        share_serial.SerialPortManager.set_interrupt_callback(DeviceJobExecutor.interrupt_port)
+        share_serial.SerialPortManager.set_reconnect_callback(DeviceJobExecutor.port_reconnected)
+        self._jobs = []  # heap of (priority, seq, enqueue time, future, job)
+        self._jobs_cond = threading.Condition()
+        self._seq = itertools.count()
+        self._current = None
+        self._running = []
+        self._stats = {p: {"jobs": 0, "wait": 0.0, "max_wait": 0.0, "preempted": 0} for p in PRIORITY_NAMES}
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def for_port(port_name=None):
+        """The executor for port_name, default the port currently open."""
+        if port_name is None:
+            port_name = share_serial.SerialPortManager.port_name()
+        with DeviceJobExecutor._executors_lock:
+            executor = DeviceJobExecutor._executors.get(port_name)
+            if executor is None:
+                executor = DeviceJobExecutor(port_name)
+                DeviceJobExecutor._executors[port_name] = executor
+            return executor
+
+    # ── Tk delivery ────────────────────────────────────────
+
+    @staticmethod
+    def attach_tk(widget):
+        """Deliver callbacks on the Tk thread of widget from now on. Call from the Tk thread."""
+        DeviceJobExecutor._tk_widget = widget
+        DeviceJobExecutor._poll_ui_queue()
+
+    @staticmethod
+    def _poll_ui_queue():
+        widget = DeviceJobExecutor._tk_widget
+        try:
+            while True:
+                fn, args = DeviceJobExecutor._ui_queue.get_nowait()
+                try:
+                    fn(*args)
+                except Exception as e:
+                    print("Job callback failed:", e)
+        except queue.Empty:
+            pass
+        if widget is not None:
+            widget.after(DeviceJobExecutor.poll_interval_ms, DeviceJobExecutor._poll_ui_queue)
+
+    @staticmethod
+    def _deliver(fn, *args):
+        if fn is None:
+            return
+        if DeviceJobExecutor._tk_widget is not None:
+            DeviceJobExecutor._ui_queue.put((fn, args))
+        else:
+            try:
+                fn(*args)
+            except Exception as e:
+                print("Job callback failed:", e)
+
+    @staticmethod
+    def run_on_tk(fn, *args):
+        """Call fn(*args) on the Tk thread (right away without Tk), from any thread."""
+        DeviceJobExecutor._deliver(fn, *args)
+
+    @staticmethod
+    def set_status_callback(cb: Optional[Callable[[str], None]]):
+        DeviceJobExecutor._status_cb = cb
+
+    @staticmethod
+    def interrupt_port():
+        """Cancel everything queued or running on the current port. Returns False if there was nothing."""
+        with DeviceJobExecutor._executors_lock:
+            executor = DeviceJobExecutor._executors.get(share_serial.SerialPortManager.port_name())
+        if executor is None:
+            return False
+        return executor.cancel_all()
+
+    @staticmethod
+    def port_reconnected(port_name, seconds, in_session):
+        """
+        The port came back after the board was unplugged or reset. If a raw
+        REPL session was running, or transfers broke off, recover: a resume
+        job opens a fresh session (handshake) and finishes the journalled
+        transfers.
+        """
+        if in_session or journal.TransferJournal().pending():
+            DeviceJobExecutor.for_port(port_name).submit("resume", description="Recovering after reconnect")
+
+    # ── jobs ───────────────────────────────────────────────
+
+    def submit(self, kind, *args, on_progress=None, on_done=None, description=None, priority=None) -> Future:
+        """
+        Queue a job. on_progress(progress, status) and on_done(future) are called
+        on the Tk thread. Failures are reported on the status bar as well.
+        priority defaults to DEFAULT_PRIORITY of the kind.
+        """
+        if priority is None:
+            priority = DEFAULT_PRIORITY.get(kind, NORMAL)
+        future = Future()
+        token = mypyboard.CancelToken()
+        future.cancel_token = token
+        job = (kind, args, on_progress, description or kind, priority, token)
+
+        def done(f):
+            if f.cancelled() or isinstance(f.exception(), mypyboard.PyboardCancelled):
+                self._deliver(DeviceJobExecutor._status_cb, f"{job[3]} cancelled")
+            elif f.exception() is not None:
+                self._deliver(DeviceJobExecutor._status_cb, f"{job[3]} failed: {f.exception()}")
+            self._deliver(on_done, f)
+
+        future.add_done_callback(done)
+        with self._jobs_cond:
+            heapq.heappush(self._jobs, (priority, next(self._seq), time.monotonic(), future, job))
+            self._jobs_cond.notify()
+        return future
+
+    def cancel(self, future):
+        """Cancel the job of future, queued or running."""
+        if not future.cancel():
+            future.cancel_token.cancel()
+
+    def cancel_all(self):
+        """Cancel all queued and running jobs. Returns False if there were none."""
+        with self._jobs_cond:
+            queued = [entry[3] for entry in self._jobs]
+            running = list(self._running)
+        for future in queued:
+            future.cancel()
+        for job in running:
+            job[5].cancel()
+        return bool(queued or running)
+
+    def stats(self):
+        """Per priority class: jobs waiting now, jobs started, average and longest wait (ms), times it preempted a transfer."""
+        with self._jobs_cond:
+            depth = {p: 0 for p in PRIORITY_NAMES}
+            for entry in self._jobs:
+                depth[entry[0]] += 1
+            report = {}
+            for p, name in PRIORITY_NAMES.items():
+                st = self._stats[p]
+                report[name] = {
+                    "depth": depth[p],
+                    "jobs": st["jobs"],
+                    "avg_wait_ms": 1000.0 * st["wait"] / st["jobs"] if st["jobs"] else 0.0,
+                    "max_wait_ms": 1000.0 * st["max_wait"],
+                    "preempted": st["preempted"],
+                }
+            return report
+
+    def _take(self, below=None, block=True):
+        # Next job, or None. With below set only jobs of a higher class (lower number) qualify.
+        with self._jobs_cond:
+            while True:
+                if self._jobs and (below is None or self._jobs[0][0] < below):
+                    priority, _, queued, future, job = heapq.heappop(self._jobs)
+                    wait = time.monotonic() - queued
+                    st = self._stats[priority]
+                    st["jobs"] += 1
+                    st["wait"] += wait
+                    st["max_wait"] = max(st["max_wait"], wait)
+                    if below is not None:
+                        st["preempted"] += 1
+                    return future, job
+                if not block:
+                    return None
+                self._jobs_cond.wait()
+
+    # ── preemption, called by Pyboard at chunk boundaries of a transfer ──
+
+    def preempt_pending(self):
+        """True if a job of a higher class than the running one is waiting."""
+        current = self._current
+        if current is None:
+            return False
+        with self._jobs_cond:
+            return bool(self._jobs) and self._jobs[0][0] < current[4]
+
+    def run_preempting(self):
+        """Run the waiting jobs of a higher class than the running one, on this (the worker) thread."""
+        current = self._current
+        if current is None:
+            return
+        while True:
+            taken = self._take(below=current[4], block=False)
+            if taken is None:
+                break
+            self._execute(*taken)
+
+    def _on_progress(self, progress, status):
+        current = self._current
+        if current is not None:
+            self._deliver(current[2], progress, status)
+
+    def _worker(self):
+        while True:
+            self._execute(*self._take())
+
+    def _execute(self, future, job):
+        if not future.set_running_or_notify_cancel():
+            return
+        outer = self._current
+        outer_token = self.sync.cancel_token
+        with self._jobs_cond:
+            self._current = job
+            self._running.append(job)
+        self.sync.cancel_token = job[5]
+        try:
+            result = self._run(job[0], job[1])
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            self.sync.cancel_token = outer_token
+            with self._jobs_cond:
+                self._running.remove(job)
+                self._current = outer
+
+    def _run(self, kind, args):
+        s = self.sync
+        if kind == "sync":
+            return s.sync_file(*args)
+        if kind == "sync_files":
+            uploaded = 0
+            with s.session():
+                for path, remote in args[0]:
+                    s.check_cancelled()
+                    if s.sync_file(path, remote=remote):
+                        uploaded += 1
+            return uploaded
+        if kind == "sync_project":
+            return s.sync_project(*args)
+        if kind == "upload":
+            return s.sync_action("put", args[0], args[1])
+        if kind == "download":
+            return s.sync_action("get", args[0], args[1])
+        if kind == "exec":
+            return s.sync_action("exec", args[0])
+        if kind == "list":
+            return s.sync_action("dir", *args)
+        if kind == "stat":
+            return s.sync_action("stat", *args)
+        if kind == "action":
+            return s.sync_action(*args)
+        if kind == "resume":
+            return s.resume_transfers()
+        if kind == "call":
+            with s.session():
+                return args[0](s)
+        raise ValueError(f"Unknown job kind {kind}")
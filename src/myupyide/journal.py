@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+
+
+class TransferJournal:
+    """
+    Uploads and downloads in progress, so a transfer that broke off (cable
+    pulled, board reset) can continue where it stopped instead of at byte zero.
+
+    Kept in transfers.json, like settings.json in the current directory. One
+    entry per direction and remote path:
+        {"direction": "put" or "get", "local": ..., "remote": ..., "port": ...,
+         "size": ..., "hash": ..., "offset": ...}
+    For uploads size and hash describe the local file, for downloads the remote
+    one (its mtime stands in for the hash, hashing all of it would cost as much
+    as the download). offset is the last position the receiving side confirmed.
+    Nothing in here is trusted blindly: before resuming, the prefix up to offset
+    is hashed on both sides.
+    """
+
+    filename = "transfers.json"
+
+    # Transfers below this size are not journalled, starting over is cheap
+    min_size = 32768
+
+    # Bytes between journal writes while a transfer runs
+    commit_interval = 16384
+
+    _lock = threading.Lock()
+
+    def __init__(self, filename=None):
+        if filename is not None:
+            self.filename = filename
+
+    @staticmethod
+    def _key(direction, remote):
+        return f"{direction}:{remote}"
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return {}
+        try:
+            with open(self.filename, "r") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _save(self, entries):
+        with open(self.filename, "w") as f:
+            json.dump(entries, f, indent=1)
+
+    def entry(self, direction, remote):
+        with TransferJournal._lock:
+            return self._load().get(self._key(direction, remote))
+
+    def pending(self):
+        """All unfinished transfers, oldest first."""
+        with TransferJournal._lock:
+            return list(self._load().values())
+
+    def start(self, direction, local, remote, size, digest, port=None, offset=0):
+        """Record a transfer. Returns the commit(offset) callback to pass to the transfer."""
+        entry = {
+            "direction": direction, "local": os.path.abspath(local), "remote": remote, "port": port,
+            "size": size, "hash": digest, "offset": offset,
+        }
+        key = self._key(direction, remote)
+        with TransferJournal._lock:
+            entries = self._load()
+            entries[key] = entry
+            self._save(entries)
+
+        last = [offset]
+
+        def commit(position):
+            if position - last[0] < self.commit_interval and position < size:
+                return
+            last[0] = position
+            with TransferJournal._lock:
+                entries = self._load()
+                if key in entries:
+                    entries[key]["offset"] = position
+                    self._save(entries)
+
+        return commit
+
+    def finish(self, direction, remote):
+        with TransferJournal._lock:
+            entries = self._load()
+            if entries.pop(self._key(direction, remote), None) is not None:
+                self._save(entries)
@@ -0,0 +1,217 @@
+import threading
+import time
+
+from . import mypyboard
+
+
+# Device side of the link probe: acknowledges a few single bytes (round trip),
+# then takes in a block of n bytes (throughput), acknowledging every piece of p bytes.
+_probe_code = """\
+import sys
+r=sys.stdin.buffer.read
+a=sys.stdout.write
+for i in range(%u):
+ r(1)
+ a('\\x06')
+n=%u
+p=%u
+while n:
+ m=min(n,p)
+ n-=m
+ while m:
+  m-=len(r(m))
+ a('\\x06')
+"""
+
+
+class LinkProfile:
+    """
+    How fast and how reliably a board takes data: round trip time, throughput,
+    the raw-paste window it reports and the errors seen so far. Probed once per
+    connection, kept per port and board type (sys.implementation, see
+    Pyboard.board_id), so a board that acted up keeps its careful settings
+    across sessions.
+
+    apply() sets a Pyboard's chunk sizes and pacing from it (not those of the
+    chunked upload for boards without sys.stdin.buffer, that one keeps its delay). While a transfer
+    runs the board reports every acknowledged frame (ack()) and every lost or
+    mangled one (error()): frames that take much longer than the measured link
+    explains shrink the window of frames in flight for the rest of the
+    transfer, errors make the following transfers use small frames, one at a time.
+    """
+
+    _profiles = {}  # (port, board_id) -> LinkProfile
+    _lock = threading.Lock()
+
+    probe_echoes = 3
+    probe_bytes = 4096
+
+    max_chunk = 1024
+    max_window = 4
+    # Above this share of failed transfers, play it safe
+    max_error_rate = 0.05
+    # An acknowledgement this many times later than expected counts as a slowdown
+    slow_factor = 4.0
+    # Clean acknowledgements before a shrunk window grows again
+    regrow_acks = 32
+    # Bytes/s from which bigger download chunks pay off
+    fast_link = 20000
+
+    def __init__(self, port, board_id):
+        self.port = port
+        self.board_id = board_id
+        self.generation = None
+        self.rtt = None
+        self.bandwidth = None
+        self.paste_window = None
+        self.stream_chunk_size = 256
+        self.stream_window = 1
+        self.transfers = 0
+        self.errors = 0
+        self.last_error = None
+        self.acks = 0
+        self.slow_acks = 0
+        self._clean_acks = 0
+        self.paste_bytes = 0
+        self.paste_seconds = 0.0
+        self.paste_stalls = 0
+
+    @staticmethod
+    def for_board(port, generation, board):
+        """The profile of board on port, probed if this connection hasn't been yet, applied to board."""
+        key = (port, board.board_id())
+        with LinkProfile._lock:
+            profile = LinkProfile._profiles.get(key)
+            if profile is None:
+                profile = LinkProfile(*key)
+                LinkProfile._profiles[key] = profile
+        if profile.generation != generation:
+            profile.probe(board)
+            profile.generation = generation
+        profile.apply(board)
+        board.profile = profile
+        return profile
+
+    @staticmethod
+    def report():
+        """One line per known board: what was measured and what it's set to."""
+        with LinkProfile._lock:
+            profiles = list(LinkProfile._profiles.values())
+        return [p.describe() for p in profiles]
+
+    def describe(self):
+        rtt = f"{self.rtt * 1000:.1f} ms" if self.rtt is not None else "?"
+        bandwidth = f"{self.bandwidth / 1024:.1f} KB/s" if self.bandwidth else "?"
+        return (f"{self.board_id} on {self.port}: rtt {rtt}, {bandwidth}, paste window {self.paste_window}, "
+                f"frames {self.stream_chunk_size} B x {self.stream_window}, "
+                f"{self.transfers} transfers, {self.errors} errors ({self.last_error}), {self.slow_acks} slow acks, "
+                f"raw paste {self.paste_rate() / 1024:.1f} KB/s with {self.paste_stalls} window stalls")
+
+    def paste_rate(self):
+        return self.paste_bytes / self.paste_seconds if self.paste_seconds else 0.0
+
+    def error_rate(self):
+        return self.errors / (self.transfers + self.errors) if self.errors else 0.0
+
+    # ── measuring ──────────────────────────────────────────
+
+    def probe(self, board):
+        if board.probe_caps().get("stdin_buffer"):
+            self._probe_stream(board)
+        else:
+            # No raw stdin: one empty exec, a handful of round trips, gives an idea
+            start = time.time()
+            board.exec_("pass")
+            self.rtt = (time.time() - start) / 4
+        if board.paste_window:
+            self.paste_window = board.paste_window
+
+    def _probe_stream(self, board):
+        # The block goes in pieces of half the raw-paste window, two at most in
+        # flight: no more unread bytes than the board said it can buffer.
+        piece = max(16, (board.paste_window or 128) // 2)
+        board.exec_raw_no_follow(_probe_code % (self.probe_echoes, self.probe_bytes, piece))
+        rtts = []
+        try:
+            for _ in range(self.probe_echoes):
+                start = time.time()
+                board.serialconnection.write(b"U")
+                if board._read_exact(1, 2) != mypyboard.STREAM_ACK:
+                    raise mypyboard.PyboardError("no echo")
+                rtts.append(time.time() - start)
+            start = time.time()
+            for i in range(0, self.probe_bytes, piece):
+                board.serialconnection.write(b"U" * min(piece, self.probe_bytes - i))
+                if i and board._read_exact(1, 10) != mypyboard.STREAM_ACK:
+                    raise mypyboard.PyboardError("probe block lost")
+            if board._read_exact(1, 10) != mypyboard.STREAM_ACK:
+                raise mypyboard.PyboardError("probe block lost")
+            elapsed = time.time() - start
+        except mypyboard.PyboardError as e:
+            board._interrupt()
+            self.errors += 1
+            self.last_error = f"probe: {e}"
+            return
+        board.follow(10)
+        self.rtt = min(rtts)
+        self.bandwidth = self.probe_bytes / max(elapsed - self.rtt, 1e-4)
+
+    # ── tuning ─────────────────────────────────────────────
+
+    def apply(self, board):
+        paste = self.paste_window or 128
+        careful = self.error_rate() > self.max_error_rate
+        fast = not careful and self.bandwidth is not None and self.bandwidth >= self.fast_link
+
+        chunk = min(self.max_chunk, max(64, 2 * paste))
+        window = 1
+        if self.bandwidth and self.rtt:
+            # Enough frames in flight to cover the round trip
+            window = min(self.max_window, 1 + int(self.bandwidth * self.rtt / chunk))
+        if careful:
+            chunk = max(64, chunk // 2)
+            window = 1
+        self.stream_chunk_size = chunk
+        self.stream_window = window
+
+        board.stream_chunk_size = chunk
+        board.stream_window = window
+        board.stream_get_chunk_size = 3072 if fast else 768  # multiple of 3, no base64 padding
+        board.read_chunk_size = 1024 if fast else 256
+        # put_chunk_size and put_chunk_delay are left alone: the chunked upload only
+        # runs on boards without sys.stdin.buffer, which need its fixed pacing
+        if self.bandwidth:
+            # The plain raw REPL has no flow control: no faster than the board took the probe
+            delay = board.raw_chunk_size / self.bandwidth * (2 if careful else 1)
+            board.raw_chunk_delay = min(0.05, max(0.002, delay))
+        self._clean_acks = 0
+
+    def ack(self, board, seconds, size):
+        """A frame of size bytes was acknowledged seconds after it was sent."""
+        self.acks += 1
+        expected = (self.rtt or 0.01) + board.stream_window * size / (self.bandwidth or 10000)
+        if seconds > self.slow_factor * expected + 0.02:
+            self.slow_acks += 1
+            self._clean_acks = 0
+            if board.stream_window > 1:
+                board.stream_window -= 1
+        else:
+            self._clean_acks += 1
+            if self._clean_acks >= self.regrow_acks and board.stream_window < self.stream_window:
+                board.stream_window += 1
+                self._clean_acks = 0
+
+    def paste_done(self, size, seconds, stalls):
+        """An exec of size bytes went through raw paste, waiting for the window stalls times."""
+        self.paste_bytes += size
+        self.paste_seconds += seconds
+        self.paste_stalls += stalls
+
+    def transfer_done(self):
+        self.transfers += 1
+
+    def error(self, board, what):
+        """Data got lost or mangled on the way; what: a few words for the report."""
+        self.errors += 1
+        self.last_error = what
+        board.stream_window = 1
@@ -0,0 +1,259 @@
+import ast
+import hashlib
+import os
+import zlib
+
+
+# Device side: report (path, size, hash) for the given paths and/or a directory
+# walk, in one exec. Only files listed in S with a matching size are hashed, the
+# rest just report their size (cheap, straight from ilistdir/stat). Directories
+# report size -1, missing files size None.
+# sha256 when the board has hashlib, crc32 from binascii otherwise.
+_manifest_code = """\
+import os
+try:
+ import hashlib
+ def H(p):
+  s=hashlib.sha256()
+  f=open(p,'rb')
+  while 1:
+   b=f.read(512)
+   if not b:break
+   s.update(b)
+  f.close()
+  return 'sha256:'+''.join('%%02x'%%x for x in s.digest())
+except ImportError:
+ import binascii
+ def H(p):
+  c=0
+  f=open(p,'rb')
+  while 1:
+   b=f.read(512)
+   if not b:break
+   c=binascii.crc32(b,c)
+  f.close()
+  return 'crc32:%%08x'%%(c&0xffffffff)
+S=%r
+def E(p,n):
+ h=None
+ if S is None or S.get(p)==n:h=H(p)
+ print(repr((p,n,h)),end=',')
+def W(d,deep):
+ for e in (os.ilistdir(d) if d else os.ilistdir()):
+  p=d.rstrip('/')+'/'+e[0] if d else e[0]
+  if e[1]&0x4000:
+   print(repr((p,-1,None)),end=',')
+   if deep:W(p,deep)
+  else:E(p,e[3] if len(e)>3 else os.stat(p)[6])
+for p in %r:
+ try:E(p,os.stat(p)[6])
+ except OSError:print(repr((p,None,None)),end=',')
+R=%r
+if R is not None:W(R,%r)
+"""
+
+# Device side: (size, mtime, n, hash of the first n bytes) of one file, n being
+# at most the given length. (None, None, 0, None) if the file doesn't exist.
+# Used to check what part of a broken off transfer can be kept.
+_prefix_hash_code = """\
+import os
+P=%r
+try:
+ t=os.stat(P)
+ z=t[6];n=min(z,%d);h=None
+except OSError:
+ z=None;n=0;h=None
+if z is not None:
+ try:
+  import hashlib
+  s=hashlib.sha256()
+ except ImportError:
+  import binascii
+  s=None
+ c=0
+ f=open(P,'rb')
+ m=n
+ while m:
+  b=f.read(min(m,512))
+  if not b:break
+  m-=len(b)
+  if s:s.update(b)
+  else:c=binascii.crc32(b,c)
+ f.close()
+ h='sha256:'+''.join('%%02x'%%x for x in s.digest()) if s else 'crc32:%%08x'%%(c&0xffffffff)
+ print(repr((z,t[8],n,h)))
+else:print(repr((z,None,n,h)))
+"""
+
+
+def _read_blocks(path, limit=None):
+    with open(path, "rb") as f:
+        remaining = limit
+        while remaining is None or remaining > 0:
+            block = f.read(65536 if remaining is None else min(65536, remaining))
+            if not block:
+                break
+            if remaining is not None:
+                remaining -= len(block)
+            yield block
+
+
+def file_hash(path, algorithm="sha256", limit=None):
+    """Hash of a local file (its first limit bytes) in the same notation the device uses, e.g. 'sha256:ab12...'."""
+    if algorithm == "sha256":
+        h = hashlib.sha256()
+        for block in _read_blocks(path, limit):
+            h.update(block)
+        return "sha256:" + h.hexdigest()
+    if algorithm == "crc32":
+        c = 0
+        for block in _read_blocks(path, limit):
+            c = zlib.crc32(block, c)
+        return "crc32:%08x" % (c & 0xFFFFFFFF)
+    raise ValueError(f"Unknown hash algorithm {algorithm}")
+
+
+class Manifest:
+    """
+    What is on the board, by size and content hash.
+
+    Remote hashes are computed on the device in a single exec. Hashes of files
+    we uploaded ourselves, or hashed before, are cached per port and remote path,
+    so a file whose local hash and remote size still match the cache is not
+    hashed on the device again.
+    """
+
+    # {(port, remote_path): (size, hash)}
+    _cache = {}
+
+    # {(local_path, algorithm): (mtime_ns, size, hash)}, saves rehashing unchanged local files
+    _local_hashes = {}
+
+    def __init__(self, port=None):
+        self.port = port
+        self.last_remote = {}
+
+    # ── local side ─────────────────────────────────────────
+
+    @staticmethod
+    def local_hash(path, algorithm="sha256"):
+        st = os.stat(path)
+        key = (os.path.abspath(path), algorithm)
+        cached = Manifest._local_hashes.get(key)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        digest = file_hash(path, algorithm)
+        Manifest._local_hashes[key] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    @staticmethod
+    def _algorithm(digest):
+        return digest.split(":", 1)[0]
+
+    # ── cache ──────────────────────────────────────────────
+
+    def remember(self, remote_path, size, digest):
+        Manifest._cache[(self.port, remote_path)] = (size, digest)
+
+    def remember_upload(self, local_path, remote_path):
+        """Record that remote_path now holds the content of local_path."""
+        algorithm = "sha256"
+        cached = Manifest._cache.get((self.port, remote_path))
+        if cached is not None:
+            algorithm = self._algorithm(cached[1])
+        self.remember(remote_path, os.path.getsize(local_path), self.local_hash(local_path, algorithm))
+
+    def forget(self, remote_path):
+        Manifest._cache.pop((self.port, remote_path), None)
+
+    @staticmethod
+    def forget_port(port):
+        for key in [k for k in Manifest._cache if k[0] == port]:
+            del Manifest._cache[key]
+
+    def _vouched(self, local_path, remote_path):
+        # Cache says the board has exactly this content (pending a size check on the board).
+        cached = Manifest._cache.get((self.port, remote_path))
+        if cached is None:
+            return False
+        size, digest = cached
+        if size != os.path.getsize(local_path):
+            return False
+        return self.local_hash(local_path, self._algorithm(digest)) == digest
+
+    # ── remote side ────────────────────────────────────────
+
+    def remote(self, board, paths=(), root=None, deep=False, expected_sizes=None):
+        """
+        {remote_path: (size, hash)} straight from the board, in one exec.
+
+        paths: files to report. root: directory to walk as well (deep: recursively).
+        expected_sizes: {path: size}; only those files are hashed, and only if the
+        size matches. None hashes everything.
+        """
+        buf = bytearray()
+
+        def repr_consumer(b):
+            buf.extend(b.replace(b"\x04", b""))
+
+        cmd = _manifest_code % (expected_sizes, list(paths), root, deep)
+        buf.extend(b"[")
+        board.exec_(cmd, data_consumer=repr_consumer)
+        buf.extend(b"]")
+
+        result = {}
+        self.last_remote = result
+        for path, size, digest in ast.literal_eval(buf.decode()):
+            result[path] = (size, digest)
+            if digest is not None:
+                self.remember(path, size, digest)
+            elif size is None:
+                self.forget(path)
+        return result
+
+    @staticmethod
+    def remote_prefix(board, path, length):
+        """(size, mtime, n, hash of the first n bytes) of path on the board, n = min(size, length)."""
+        buf = bytearray()
+        board.exec_(_prefix_hash_code % (path, length), data_consumer=lambda b: buf.extend(b.replace(b"\x04", b"")))
+        return ast.literal_eval(buf.decode().strip())
+
+    def compare(self, board, pairs, verify=False, root=None, deep=False):
+        """
+        Status of each (local_path, remote_path) pair: 'new', 'changed' or 'same'.
+
+        With root set, the directory listing comes along in the same exec and
+        remote files without a local counterpart are reported as 'remote'.
+        The raw listing (directories included) is kept in last_remote.
+        With verify set the cache is not trusted and everything is hashed on the device.
+        """
+        pairs = list(pairs)
+        expected = {}
+        vouched = set()
+        for local_path, remote_path in pairs:
+            if not verify and self._vouched(local_path, remote_path):
+                vouched.add(remote_path)
+            else:
+                expected[remote_path] = os.path.getsize(local_path)
+
+        paths = [] if root is not None else [remote_path for _, remote_path in pairs]
+        remote = self.remote(board, paths, root=root, deep=deep, expected_sizes=expected)
+
+        status = {}
+        for local_path, remote_path in pairs:
+            size, digest = remote.get(remote_path, (None, None))
+            if size is None or size < 0:
+                status[remote_path] = "new"
+            elif size != os.path.getsize(local_path):
+                status[remote_path] = "changed"
+            elif remote_path in vouched:
+                status[remote_path] = "same"
+            elif digest is not None and digest == self.local_hash(local_path, self._algorithm(digest)):
+                status[remote_path] = "same"
+            else:
+                status[remote_path] = "changed"
+
+        for remote_path, (size, _) in remote.items():
+            if remote_path not in status and size is not None and size >= 0:
+                status[remote_path] = "remote"
+        return status
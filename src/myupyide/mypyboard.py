@@ -39,14 +39,19 @@ connection.
 
 
 import ast
+import binascii
+import collections
 import errno
 import os
 import struct
 import sys
+import threading
 import time
+import zlib
 import serial
 
 from collections import namedtuple
+from contextlib import contextmanager
 
 try:
     stdout = sys.stdout.buffer
@@ -70,6 +75,27 @@ class PyboardError(Exception):
         return self
 
 
+class PyboardCancelled(PyboardError):
+    pass
+
+
+class CancelToken:
+    """
+    Cancels a transfer or exec from another thread. The Pyboard stops at the
+    next chunk boundary, closes the remote file and leaves the raw REPL usable.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
 listdir_result = namedtuple("dir_result", ["name", "st_mode", "st_ino", "st_size"])
 
 
@@ -235,13 +261,448 @@ class ProcessPtyToTerminal:
         return self.serial.inWaiting()
 
 
+RAW_REPL_BANNER = b"raw REPL; CTRL-B to exit\r\n>"
+
+# Streaming transfers
+#
+# A streamed transfer runs one small loop on the device that talks to the host
+# over the raw REPL's stdin/stdout while the exec is in progress. Data is sent in
+# frames: 4 hex digits with the payload length, then the payload. A zero length
+# frame ends the stream.
+#
+# Device to host payloads are base64 encoded, the stream starts with the total
+# size in 8 hex digits.
+#
+# Host to device payloads are binary. The device acknowledges readiness and each
+# frame with ACK, so there is never more than a window of data in flight.
+# Control characters the REPL could act on (Ctrl-A..Ctrl-E, Ctrl-C in particular)
+# and the escape byte itself are sent as DLE followed by the byte xor 0x20.
+
+STREAM_ACK = b"\x06"
+STREAM_DLE = 0x10
+_STREAM_ESCAPED = (0x10, 0x01, 0x02, 0x03, 0x04, 0x05)  # DLE first!
+
+
+def stream_escape(data):
+    for c in _STREAM_ESCAPED:
+        if c in data:
+            data = data.replace(bytes((c,)), bytes((STREAM_DLE, c ^ 0x20)))
+    return data
+
+
+# Device side frame reader, shared by the streaming receivers.
+_stream_rx_code = """\
+import sys
+r=sys.stdin.buffer.read
+a=sys.stdout.write
+def u(b):
+ i=b.find(b'\\x10')
+ if i<0:return b
+ o=bytearray()
+ j=0
+ while i>=0:
+  o+=b[j:i];o.append(b[i+1]^32);j=i+2;i=b.find(b'\\x10',j)
+ o+=b[j:]
+ return o
+def nf():
+ n=int(r(4),16)
+ if not n:return b''
+ return u(r(n))
+"""
+
+_stream_put_code = _stream_rx_code + """\
+f=open('%s','%s')
+f.seek(%u)
+w=f.write
+a('\\x06')
+while 1:
+ b=nf()
+ if not b:break
+ w(b)
+ a('\\x06')
+f.close()
+"""
+
+# Device side reader over the frames of an upload, as a stream (x), so a
+# decompressor can wrap it. A frame is acknowledged when it is taken in.
+_stream_reader_code = _stream_rx_code + """\
+import io
+class X(io.IOBase):
+ def __init__(s):s.b=b'';s.i=0;s.e=0
+ def readinto(s,m):
+  if s.e:return 0
+  if s.i>=len(s.b):
+   s.b=nf();s.i=0
+   if not s.b:
+    s.e=1
+    return 0
+   a('\\x06')
+  n=min(len(m),len(s.b)-s.i)
+  m[:n]=s.b[s.i:s.i+n]
+  s.i+=n
+  return n
+ def read(s,n):
+  b=bytearray(n)
+  return b[:s.readinto(b)]
+ def ioctl(s,r,g):return 0
+x=X()
+"""
+
+# The decompressor (D, see _inflate_setup) over x, made on the first read: the
+# old zlib/uzlib.DecompIO read the zlib header when constructed, which would
+# block before the readiness ACK is sent and the host never sends anything.
+_lazy_inflate_code = """\
+class Z:
+ d=None
+ def read(s,n):
+  if not s.d:s.d=D(x)
+  return s.d.read(n)
+d=Z()
+"""
+
+# Compressed upload: the frames carry one zlib stream, which a decompressor
+# (D, see _inflate_setup) reads from x.
+_stream_put_z_code = _stream_reader_code + """\
+%s
+""" + _lazy_inflate_code + """\
+f=open('%s','%s')
+f.seek(%u)
+w=f.write
+a('\\x06')
+while 1:
+ b=d.read(512)
+ if not b:break
+ w(b)
+while x.readinto(bytearray(16)):pass
+f.close()
+"""
+
+# The upload stream through a decompressor (D, see _inflate_setup), R(n)
+# reads exactly n bytes of it.
+_stream_record_code = _stream_reader_code + """\
+%s
+""" + _lazy_inflate_code + """\
+def R(n):
+ b=b''
+ while len(b)<n:
+  k=d.read(n-len(b))
+  if not k:raise EOFError
+  b+=k
+ return b
+"""
+
+# Bundle upload: many files in one stream, optionally deflated. Per file 4 hex
+# digits path length, the path, 8 hex digits size and the content; a zero path
+# length ends it. Parent directories are created as needed. Prints
+# (files written, bytes written, [(path, error)]).
+_bundle_code = _stream_record_code + """\
+import os
+S=set()
+k=0
+t=0
+E=[]
+a('\\x06')
+while 1:
+ n=int(R(4),16)
+ if not n:break
+ p=R(n).decode()
+ z=int(R(8),16)
+ y=z
+ f=None
+ try:
+  i=p.find('/',1)
+  while i>0:
+   h=p[:i]
+   if h not in S:
+    try:os.mkdir(h)
+    except OSError:pass
+    S.add(h)
+   i=p.find('/',i+1)
+  f=open(p,'wb')
+ except Exception as e:
+  E.append((p,str(e)))
+ while z:
+  b=R(min(z,512))
+  z-=len(b)
+  if f:
+   try:f.write(b)
+   except Exception as e:
+    E.append((p,str(e)))
+    f.close()
+    f=None
+ if f:
+  f.close()
+  k+=1
+  t+=y
+while x.readinto(bytearray(16)):pass
+print(repr((k,t,E)))
+"""
+
+# Block checksums for a delta upload: 8 hex digits size, then the crc32 of
+# every block of the file, 8 hex digits each. None if the file is missing, a
+# directory, smaller than asked or the board has no crc32.
+_delta_sums_code = """\
+import os,sys
+try:
+ from binascii import crc32
+except ImportError:
+ try:
+  from ubinascii import crc32
+ except ImportError:
+  crc32=None
+try:
+ s=os.stat('%s')
+ s=-1 if s[0]&0x4000 else s[6]
+except OSError:
+ s=-1
+if crc32 is None or s<%u:
+ print('None')
+else:
+ a=sys.stdout.write
+ a('%%08x'%%s)
+ f=open('%s','rb')
+ b=bytearray(%u)
+ m=memoryview(b)
+ while 1:
+  n=f.readinto(b)
+  if not n:break
+  a('%%08x'%%crc32(m[:n]))
+ f.close()
+"""
+
+# Delta upload: patches the file in place. Per run 8 hex digits offset, 8 hex
+# digits length and the data; a zero length ends it.
+_delta_patch_code = _stream_record_code + """\
+f=open('%s','r+b')
+a('\\x06')
+while 1:
+ o=int(R(8),16)
+ n=int(R(8),16)
+ if not n:break
+ f.seek(o)
+ while n:
+  b=R(min(n,512))
+  n-=len(b)
+  f.write(b)
+while x.readinto(bytearray(16)):pass
+f.close()
+"""
+
+# crc32 of a whole file, to check a delta upload
+_delta_crc_code = """\
+try:
+ from binascii import crc32
+except ImportError:
+ from ubinascii import crc32
+f=open('%s','rb')
+b=bytearray(512)
+m=memoryview(b)
+c=0
+while 1:
+ n=f.readinto(b)
+ if not n:break
+ c=crc32(m[:n],c)
+f.close()
+print('%%08x'%%c)
+"""
+
+# Decompressor setup for _stream_put_z_code, _stream_record_code, by caps['inflate']
+_inflate_setup_code = {
+    None: "D=lambda s:s",
+    "deflate": "import deflate\nD=lambda s:deflate.DeflateIO(s,deflate.ZLIB)",
+    "zlib": "import zlib\nD=lambda s:zlib.DecompIO(s,%d)",
+    "uzlib": "import uzlib\nD=lambda s:uzlib.DecompIO(s,%d)",
+}
+
+_stream_get_code = """\
+import sys,os
+try:
+ import binascii
+except ImportError:
+ import ubinascii as binascii
+e=binascii.b2a_base64
+a=sys.stdout.write
+def F(b):
+ b=e(b)[:-1]
+ a('%%04x'%%len(b))
+ a(b.decode())
+W=F
+f=open('%s','rb')
+r=f.read
+Z=os.stat('%s')[6]
+a('%%08x'%%Z)
+O=%u
+if O:f.seek(O)
+m=%d
+C=%u
+%s
+while m:
+ b=r(C if m<0 or m>C else m)
+ if not b:break
+ m-=len(b)
+ W(b)
+%s
+f.close()
+a('0000')
+"""
+
+# Compressed download: W feeds a compressor that writes its output as frames.
+_stream_get_z_setup = """\
+import io,deflate
+class G(io.IOBase):
+ def write(s,b):
+  for i in range(0,len(b),C):F(b[i:i+C])
+  return len(b)
+ def ioctl(s,r,g):return 0
+d=deflate.DeflateIO(G(),deflate.ZLIB,%d)
+W=d.write"""
+
+# Capability probe, one exec per board. Prints a dict literal.
+_probe_caps_code = """\
+import sys
+c={}
+c['stdin_buffer']=hasattr(sys.stdin,'buffer')
+try:
+ import binascii
+except ImportError:
+ try:
+  import ubinascii as binascii
+ except ImportError:
+  binascii=None
+c['base64']=hasattr(binascii,'b2a_base64')
+c['inflate']=None
+c['deflate_compress']=False
+try:
+ import deflate
+ c['inflate']='deflate'
+ try:
+  import io
+  z=deflate.DeflateIO(io.BytesIO(),deflate.ZLIB,8)
+  z.write(b'x')
+  z.close()
+  c['deflate_compress']=True
+ except Exception:
+  pass
+except ImportError:
+ for n in ('zlib','uzlib'):
+  try:
+   if hasattr(__import__(n),'DecompIO'):
+    c['inflate']=n
+    break
+  except ImportError:
+   pass
+print(repr(c))
+"""
+
+# Already compressed, not worth another pass
+_incompressible_suffixes = (".gz", ".zip", ".z", ".png", ".jpg", ".jpeg", ".gif", ".mp3", ".ogg", ".bz2", ".xz")
+
+
+class _FrameSender:
+    """
+    Host side of an upload stream: cuts data into frames, escapes them, keeps
+    at most stream_window frames unacknowledged, optionally deflates on the way.
+    committed(position) is called with the position given to write() once the
+    board acknowledged the frame that carried it.
+    """
+
+    def __init__(self, board, compress=False, committed=None):
+        self.board = board
+        self.committed = committed
+        self.compressor = zlib.compressobj(board.compress_level, zlib.DEFLATED, board.compress_wbits) if compress else None
+        self.chunk = board.stream_chunk_size
+        self.outstanding = collections.deque()  # (position, time sent, size)
+        self.packed = bytearray()  # not sent yet
+        self.position = None
+
+    def write(self, data, position=None):
+        self.position = position
+        self.packed += self.compressor.compress(data) if self.compressor is not None else data
+        while len(self.packed) >= self.chunk:
+            self._frame(self.packed[: self.chunk], position)
+            del self.packed[: self.chunk]
+
+    def finish(self):
+        # Send what's left, wait for the last acknowledgements, end the stream
+        if self.compressor is not None:
+            self.packed += self.compressor.flush()
+        for i in range(0, len(self.packed), self.chunk):
+            self._frame(self.packed[i : i + self.chunk], self.position)
+        self.packed = bytearray()
+        while self.outstanding:
+            self._ack()
+        self.board.serialconnection.write(b"0000")
+        if self.board.profile is not None:
+            self.board.profile.transfer_done()
+
+    def _frame(self, data, position):
+        payload = stream_escape(bytes(data))
+        self.board.serialconnection.write(b"%04x" % len(payload) + payload)
+        self.outstanding.append((position, time.time(), len(payload) + 4))
+        while len(self.outstanding) >= self.board.stream_window:
+            self._ack()
+
+    def _ack(self):
+        self.board._stream_wait_ack()
+        position, sent, size = self.outstanding.popleft()
+        if self.board.profile is not None:
+            self.board.profile.ack(self.board, time.time() - sent, size)
+        if self.committed and position is not None:
+            self.committed(position)
+
+
 class Pyboard:
+    # Escalating waits (seconds) for the fast raw REPL handshake. Most boards
+    # answer within the first step; a busy program may need one of the later ones.
+    handshake_ladder = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0)
+
     def __init__(
         self, device, serialport=None, _progress_callback=None, baudrate=115200, user="micro", password="python", wait=0, exclusive=True
     ):
         self.in_raw_repl = False
         self.use_raw_paste = True
         self.progress_callback=_progress_callback
+        self.fast_handshake = False
+        self.handshake_time = None
+        self._board_id = None
+        self.caps = None
+        self.stream_chunk_size = 256
+        self.stream_window = 1
+        self.stream_get_chunk_size = 768
+        # Chunk sizes and pacing of the non-streaming paths. A LinkProfile
+        # (see linkprofile.py) tunes these and the stream sizes above to the
+        # measured link, and adjusts stream_window while frames go out.
+        self.profile = None
+        self.paste_window = None  # as reported by the board in raw-paste mode
+        self._rx_pending = bytearray()  # read past the ending by read_until, see _read()
+        self.paste_stats = {"bytes": 0, "seconds": 0.0, "stalls": 0, "stall_seconds": 0.0}
+        self.raw_chunk_size = 256
+        self.raw_chunk_delay = 0.01
+        self.put_chunk_size = 64
+        self.put_chunk_delay = 0.05
+        self.read_chunk_size = 256
+        # With a scheduler set (see jobs.DeviceJobExecutor) streamed transfers
+        # pause at chunk boundaries while it has more urgent jobs, and resume
+        # afterwards. Downloads are then fetched in segments of this many bytes.
+        self.scheduler = None
+        self.stream_get_segment = 32768
+        # CancelToken checked at chunk boundaries, and while waiting for exec output
+        self.cancel_token = None
+        # Compressed streaming, when the board has deflate/zlib (see probe_caps).
+        # compress_level 0 turns it off. A small window keeps the device's
+        # buffers small. Files smaller than compress_min_size, or that don't
+        # shrink below compress_max_ratio in a trial run, go uncompressed.
+        self.compress_level = 6
+        self.compress_wbits = 10
+        self.compress_min_size = 512
+        self.compress_max_ratio = 0.9
+        # Delta uploads: when the remote file exists and is at least
+        # delta_min_size, only the blocks that differ are sent and patched in
+        # place. If more than delta_max_ratio of the file changed, a plain
+        # upload it is.
+        self.delta_min_size = 32768
+        self.delta_block_size = 1024
+        self.delta_max_ratio = 0.5
 
         #i'm leaving the code for alternative connection methods in place. might be useful some day.
         if device.startswith("exec:"):
@@ -259,7 +720,8 @@ class Pyboard:
             import serial.tools.list_ports
 
             # Set options, and exclusive if pyserial supports it
-            serial_kwargs = {"baudrate": baudrate, "interCharTimeout": 1}
+            # A read timeout, like the shared port's: read_until blocks on reads
+            serial_kwargs = {"baudrate": baudrate, "interCharTimeout": 1, "timeout": 0.1}
             if serial.__version__ >= "3.3":
                 serial_kwargs["exclusive"] = exclusive
 
@@ -310,38 +772,59 @@ class Pyboard:
 
 
     def read_until(self, min_num_bytes, ending, timeout=10, data_consumer=None):
+        # Reads whatever is there in one go, and blocks on the port (its read
+        # timeout) when nothing is; no polling sleeps. Bytes that came in after
+        # the ending are pushed back for the next read (the error output of an
+        # exec, say). With a data_consumer the data is handed over in chunks as
+        # it arrives, ending included, and only the last chunk is returned.
+        # timeout: seconds without any data.
         assert data_consumer is None or len(ending) == 1
 
-        data = self.serialconnection.read(min_num_bytes)
-        if data_consumer:
-            data_consumer(data)
-            data = b""
-
-        start = time.time()
+        buf = bytearray(self._read(min_num_bytes))
+        scan = 0
+        last_data = time.time()
+        interrupted = False
         while True:
-            if data.endswith(ending):
-                break
-
-            if data_consumer:
-                new_data = self.serialconnection.read(1)
-                if new_data:
-                    data_consumer(new_data)
-                    data = new_data
-            else:
-                # read as much as possible
-                n = self.serialconnection.inWaiting()
-                if n:
-                    data += self.serialconnection.read(n)
-
-            if timeout is not None and (time.time() - start) > timeout:
+            i = buf.find(ending, scan)
+            if i >= 0:
+                i += len(ending)
+                self._rx_pending[:0] = buf[i:]
+                del buf[i:]
+                if data_consumer:
+                    data_consumer(bytes(buf))
+                return bytes(buf)
+            if data_consumer and buf:
+                data_consumer(bytes(buf))
+                del buf[:]
+            scan = max(0, len(buf) - len(ending) + 1)
+
+            if not interrupted and self._cancelled():
+                # Ctrl-C the running program; it ends with a KeyboardInterrupt traceback.
+                self.serialconnection.write(b"\x03")
+                interrupted = True
+
+            data = self._read(max(1, self._in_waiting()))
+            if data:
+                buf += data
+                last_data = time.time()
+            elif timeout is not None and (time.time() - last_data) > timeout:
                 # DEBUG: show what we got
-                print("[pyboard] read_until TIMEOUT. got bytes:", repr(data[-200:]))
-                return data
-
-            time.sleep(0.01)
-
+                print("[pyboard] read_until TIMEOUT. got bytes:", repr(bytes(buf[-200:])))
+                return bytes(buf)
+
+    def _read(self, n=1):
+        # Port read that hands out the bytes read_until pushed back first
+        if not self._rx_pending:
+            return self.serialconnection.read(n)
+        data = bytes(self._rx_pending[:n])
+        del self._rx_pending[:n]
+        if len(data) < n:
+            data += self.serialconnection.read(n - len(data))
         return data
 
+    def _in_waiting(self):
+        return len(self._rx_pending) + self.serialconnection.inWaiting()
+
 
     def read_until_o(self, min_num_bytes, ending, timeout=10, data_consumer=None):
         # if data_consumer is used then data is not accumulated and the ending must be 1 byte long
@@ -372,16 +855,105 @@ class Pyboard:
                 time.sleep(0.01)
         return data
 
-    def enter_raw_repl(self, soft_reset=True):
+    def _wait_for(self, marker, timeout, data=b""):
+        # Collect input until marker shows up or timeout expires. Quiet on timeout, the caller decides.
+        deadline = time.time() + timeout
+        while True:
+            data += self._read(max(1, self._in_waiting()))
+            if marker in data:
+                return data
+            if time.time() > deadline:
+                return data
+
+    def _enter_raw_repl_fast(self, soft_reset):
+        # Interrupt whatever runs and ask for the raw REPL right away; no fixed sleep.
+        # The banner is detected as soon as it arrives, otherwise retry with a longer wait.
+        # Only the first step interrupts; later ones just repeat the ctrl-A.
+        data = b""
+        requests = 0
+        for wait in self.handshake_ladder:
+            self.serialconnection.write(b"\x01" if requests else b"\r\x03\x03\x01")
+            requests += 1
+            data = self._wait_for(RAW_REPL_BANNER, wait, data)
+            if RAW_REPL_BANNER in data:
+                break
+        else:
+            print("[pyboard] enter_raw_repl: unexpected data:", repr(data[-200:]))
+            raise PyboardError("could not enter raw repl")
+
+        # Every ctrl-A that got through answers with a banner of its own, possibly after
+        # we stopped waiting. Eat those, so they aren't taken for the output of the next
+        # command; the board is about as slow with them as it was with the first one.
+        data = data[data.index(RAW_REPL_BANNER) + len(RAW_REPL_BANNER):]
+        banners = 1
+        while banners < requests:
+            data = self._wait_for(RAW_REPL_BANNER, wait, data)
+            if RAW_REPL_BANNER not in data:
+                break
+            data = data[data.index(RAW_REPL_BANNER) + len(RAW_REPL_BANNER):]
+            banners += 1
+
+        self.in_raw_repl = True
+        if soft_reset:
+            self.soft_reset()
+
+    def soft_reset(self):
+        """Soft reset the board from within the raw REPL, and wait until it is back."""
+        self.serialconnection.write(b"\x04")  # ctrl-D: soft reset
+        data = self._wait_for(b"soft reboot\r\n", 10)
+        if b"soft reboot\r\n" not in data:
+            print(data)
+            raise PyboardError("could not soft reset")
+        # boot.py may print before the raw REPL is back
+        data = self._wait_for(RAW_REPL_BANNER, 10)
+        if RAW_REPL_BANNER not in data:
+            print("[pyboard] soft_reset: unexpected data:", repr(data[-200:]))
+            raise PyboardError("could not enter raw repl")
+
+    def enter_raw_repl(self, soft_reset=True, fast=None):
+        if fast is None:
+            fast = self.fast_handshake
+        start = time.time()
+        if fast:
+            self._enter_raw_repl_fast(soft_reset)
+        else:
+            self._enter_raw_repl_slow(soft_reset)
+        self.handshake_time = time.time() - start
+
+    def board_id(self):
+        """Short description of the board, e.g. 'micropython 1.22.0 ESP32 module with ESP32'. Cached."""
+        if self._board_id is None:
+            buf = bytearray()
+            self.exec_(
+                "import sys\n"
+                "i=sys.implementation\n"
+                "print(i.name, '.'.join(str(v) for v in i.version[:3]), getattr(i, '_machine', sys.platform))",
+                data_consumer=lambda b: buf.extend(b.replace(b"\x04", b"")),
+            )
+            self._board_id = buf.decode(errors="replace").strip()
+        return self._board_id
+
+    def probe_caps(self):
+        """Ask the board once which optional features it has, e.g. {'stdin_buffer': True}. Cached."""
+        if self.caps is None:
+            buf = bytearray()
+            try:
+                self.exec_(_probe_caps_code, data_consumer=lambda b: buf.extend(b.replace(b"\x04", b"")))
+                self.caps = ast.literal_eval(buf.decode().strip())
+            except (PyboardError, ValueError, SyntaxError):
+                self.caps = {}
+        return self.caps
+
+    def _enter_raw_repl_slow(self, soft_reset=True):
         self.serialconnection.write(b"\r\x03\x03")  # ctrl-C twice: interrupt any running program
         self.serialconnection.write(b"\r\x03\x03\x03")  # Ctrl-C x3
         time.sleep(1.0)
 
         # flush input (without relying on serial.flushInput())
-        n = self.serialconnection.inWaiting()
+        n = self._in_waiting()
         while n > 0:
-            self.serialconnection.read(n)
-            n = self.serialconnection.inWaiting()
+            self._read(n)
+            n = self._in_waiting()
 
         self.serialconnection.write(b"\r\x01")  # ctrl-A: enter raw REPL
 
@@ -442,36 +1014,51 @@ class Pyboard:
             raise PyboardError("timeout waiting for second EOF reception")
         data_err = data_err[:-1]
 
+        if self._cancelled():
+            raise PyboardCancelled("cancelled", data, data_err)
+
         # return normal and error output
         return data, data_err
 
     def raw_paste_write(self, command_bytes):
         # Read initial header, with window size.
-        data = self.serialconnection.read(2)
+        data = self._read(2)
         window_size = struct.unpack("<H", data)[0]
         window_remain = window_size
+        self.paste_window = window_size
 
-        # Write out the command_bytes data.
+        # Write out the command_bytes data: the whole window in one write, then
+        # one blocking wait for the board's go-ahead, which takes in every flow
+        # control byte that has arrived in a single read.
+        stats = self.paste_stats
+        start = time.time()
+        view = memoryview(command_bytes)
+        stalls = 0
         i = 0
-        while i < len(command_bytes):
-            while window_remain == 0 or self.serialconnection.inWaiting():
-                data = self.serialconnection.read(1)
-                if data == b"\x01":
-                    # Device indicated that a new window of data can be sent.
-                    if window_remain==0:
-                        window_remain += window_size
-                elif data == b"\x04":
-                    # Device indicated abrupt end.  Acknowledge it and finish.
-                    self.serialconnection.write(b"\x04")
-                    return
-                else:
-                    # Unexpected data from device.
-                    raise PyboardError("unexpected read during raw paste: {}".format(data))
-            # Send out as much data as possible that fits within the allowed window.
-            b = command_bytes[i : min(i + window_remain, len(command_bytes))]
-            self.serialconnection.write(b)
-            window_remain -= len(b)
-            i += len(b)
+        while True:
+            n = min(window_remain, len(view) - i)
+            if n:
+                self.serialconnection.write(view[i : i + n])
+                window_remain -= n
+                i += n
+            if i >= len(view):
+                break
+            stalled = time.time()
+            data = self._read_flow_control()
+            stalls += 1
+            stats["stalls"] += 1
+            stats["stall_seconds"] += time.time() - stalled
+            if b"\x04" in data:
+                # Device indicated abrupt end.  Acknowledge it and finish.
+                self.serialconnection.write(b"\x04")
+                return
+            grants = data.count(b"\x01")
+            if grants != len(data):
+                # Unexpected data from device.
+                self._link_error("raw paste")
+                raise PyboardError("unexpected read during raw paste: {}".format(data))
+            # Device indicated that new windows of data can be sent.
+            window_remain += grants * window_size
 
         # Indicate end of data.
         self.serialconnection.write(b"\x04")
@@ -480,6 +1067,34 @@ class Pyboard:
         data = self.read_until(1, b"\x04")
         if not data.endswith(b"\x04"):
             raise PyboardError("could not complete raw paste: {}".format(data))
+        stats["bytes"] += len(view)
+        stats["seconds"] += time.time() - start
+        if self.profile is not None:
+            self.profile.paste_done(len(view), time.time() - start, stalls)
+
+    def _read_flow_control(self, timeout=10):
+        # At least one byte, plus whatever else is waiting
+        deadline = time.time() + timeout
+        data = self._read(1)
+        while not data:
+            if time.time() > deadline:
+                self._link_error("raw paste timeout")
+                raise PyboardError("timeout waiting for raw paste flow control")
+            data = self._read(1)
+        waiting = self._in_waiting()
+        if waiting:
+            data += self._read(waiting)
+        return data
+
+    def paste_report(self):
+        """Raw-paste throughput of this connection: bytes, bytes/s, and how often (and how long) it waited for the board's window."""
+        st = self.paste_stats
+        return {
+            "bytes": st["bytes"],
+            "bytes_per_s": st["bytes"] / st["seconds"] if st["seconds"] else 0.0,
+            "stalls": st["stalls"],
+            "stall_ms": 1000.0 * st["stall_seconds"],
+        }
 
     def exec_raw_no_follow(self, command):
         if isinstance(command, bytes):
@@ -502,13 +1117,13 @@ class Pyboard:
 
 
         #ok, this seems silly. if you want to do anything sane, should clear the buffer. not sure, some black magic i have to trace:
-        if self.serialconnection.inWaiting()>0:
-            self.serialconnection.read(self.serialconnection.inWaiting())
+        if self._in_waiting()>0:
+            self._read(self._in_waiting())
 
         if self.use_raw_paste:
             # Try to enter raw-paste mode.
             self.serialconnection.write(b"\x05A\x01")
-            data = self.serialconnection.read(2)
+            data = self._read(2)
             if data == b"R\x00":
                 # Device understood raw-paste command but doesn't support it.
                 pass
@@ -526,15 +1141,16 @@ class Pyboard:
 
         self.do_progress(2, "Transfer starting")
 
-        # Write command using standard raw REPL, 256 bytes every 10ms.
-        for i in range(0, len(command_bytes), 256):
-            self.serialconnection.write(command_bytes[i : min(i + 256, len(command_bytes))])
-            self.do_progress((100.0*i*256/len(command_bytes)), f"{i*256} bytes")
-            time.sleep(0.01)
+        # Write command using standard raw REPL, paced: by default 256 bytes every 10ms.
+        step = self.raw_chunk_size
+        for i in range(0, len(command_bytes), step):
+            self.serialconnection.write(command_bytes[i : min(i + step, len(command_bytes))])
+            self.do_progress((100.0*i/len(command_bytes)), f"{i} bytes")
+            time.sleep(self.raw_chunk_delay)
         self.serialconnection.write(b"\x04")
 
         # check if we could exec command
-        data = self.serialconnection.read(2)
+        data = self._read(2)
         if data != b"OK":
             raise PyboardError("could not exec command (response: %r)" % data)
 
@@ -616,14 +1232,26 @@ class Pyboard:
         except PyboardError as e:
             raise e.convert(src)
 
-    def fs_cat(self, src, chunk_size=256):
+    def fs_cat(self, src, chunk_size=None):
+        chunk_size = chunk_size or self.read_chunk_size
         cmd = (
             "with open('%s') as f:\n while 1:\n"
             "  b=f.read(%u)\n  if not b:break\n  print(b,end='')" % (src, chunk_size)
         )
         return self.exec_(cmd, data_consumer=stdout_write_bytes)
 
-    def fs_readfile(self, src, chunk_size=256):
+    def fs_readfile(self, src, chunk_size=None, streaming=None):
+        chunk_size = chunk_size or self.read_chunk_size
+        if streaming is None:
+            streaming = self.probe_caps().get("base64", False)
+        if streaming:
+            buf = bytearray()
+            try:
+                self._stream_get(src, buf.extend)
+            except PyboardError as e:
+                raise e.convert(src)
+            return buf
+
         buf = bytearray()
 
         def repr_consumer(b):
@@ -647,7 +1275,8 @@ class Pyboard:
             data = data[len(chunk) :]
         self.exec_("f.close()")
 
-    def fs_cp(self, src, dest, chunk_size=256, progress_callback=None):
+    def fs_cp(self, src, dest, chunk_size=None, progress_callback=None):
+        chunk_size = chunk_size or self.read_chunk_size
         if progress_callback:
             src_size = self.fs_stat(src).st_size
             written = 0
@@ -661,13 +1290,50 @@ class Pyboard:
                 progress_callback(written, src_size)
         self.exec_("fr.close()\nfw.close()")
 
-    def fs_get(self, src, dest, chunk_size=256, progress_callback=None):
+    def fs_get(self, src, dest, chunk_size=None, progress_callback=None, streaming=None, offset=0):
+        """Download src from the board into the local file dest.
+
+        Streams base64 frames from one device-side loop when the board has
+        binascii; otherwise (or with streaming=False) uses one exec per chunk.
+
+        offset: continue a broken off download, dest already holds the first
+        offset bytes. progress_callback(position, size) is called as data arrives.
+        """
+        if streaming is None:
+            streaming = self.probe_caps().get("base64", False)
+        try:
+            if streaming:
+                with open(dest, "r+b" if offset else "wb") as f:
+                    f.seek(offset)
+                    f.truncate()
+                    try:
+                        self._stream_get(src, f.write, progress_callback, offset)
+                    except PyboardCancelled:
+                        raise
+                    except PyboardError as e:
+                        raise e.convert(src)
+            else:
+                self._fs_get_chunked(src, dest, chunk_size, progress_callback, offset)
+        except PyboardCancelled:
+            # Don't leave half a file behind
+            os.remove(dest)
+            raise
+
+    def _fs_get_chunked(self, src, dest, chunk_size=None, progress_callback=None, offset=0):
+        chunk_size = chunk_size or self.read_chunk_size
+
         if progress_callback:
             src_size = self.fs_stat(src).st_size
-            written = 0
-        self.exec_("f=open('%s','rb')\nr=f.read" % src)
-        with open(dest, "wb") as f:
+            written = offset
+        self.exec_("f=open('%s','rb')\nf.seek(%u)\nr=f.read" % (src, offset))
+        with open(dest, "r+b" if offset else "wb") as f:
+            f.seek(offset)
+            f.truncate()
             while True:
+                if self._cancelled():
+                    with self._not_cancellable():
+                        self.exec_("f.close()")
+                    raise PyboardCancelled("download of %s cancelled" % src)
                 data = bytearray()
                 self.exec_("print(r(%u))" % chunk_size, data_consumer=lambda d: data.extend(d))
                 assert data.endswith(b"\r\n\x04")
@@ -685,17 +1351,403 @@ class Pyboard:
                     progress_callback(written, src_size)
         self.exec_("f.close()")
 
-    def fs_put(self, src, dest, chunk_size=64):
+    def _read_exact(self, n, timeout=10):
+        data = b""
+        deadline = time.time() + timeout
+        while len(data) < n:
+            chunk = self._read(n - len(data))
+            if chunk:
+                data += chunk
+            elif time.time() > deadline:
+                break
+        return data
+
+    def _stream_failed(self, data, timeout=10):
+        # The device loop died (or never started). Collect its traceback and
+        # clear anything we sent after it, so the raw REPL stays usable.
+        deadline = time.time() + timeout
+        while data.count(b"\x04") < 2 and time.time() < deadline:
+            data += self._read_exact(max(1, self._in_waiting()), timeout=0.1)
+        data, _, data_err = data.partition(b"\x04")
+        data_err = data_err.partition(b"\x04")[0]
+        self.serialconnection.write(b"\x03")
+        raise PyboardError("exception", data, data_err)
+
+    def _stream_wait_ack(self, timeout=10):
+        ack = self._read_exact(1, timeout)
+        if ack != STREAM_ACK:
+            if not ack:
+                self._link_error("ack timeout")
+            self._stream_failed(ack, timeout)
+
+    def _stream_read_header(self, width, timeout=10):
+        header = self._read_exact(width, timeout)
+        try:
+            if len(header) == width:
+                return int(header, 16)
+        except ValueError:
+            pass
+        if len(header) < width:
+            self._link_error("header timeout")
+        self._stream_failed(header, timeout)
+
+    def _link_error(self, what):
+        # The link lost or mangled data; the profile gets more careful for the next transfer
+        if self.profile is not None:
+            self.profile.error(self, what)
+
+    def _cancelled(self):
+        return self.cancel_token is not None and self.cancel_token.cancelled
+
+    def _interrupt(self, timeout=2):
+        # Ctrl-C a streaming exec that isn't reading from us, and skip its output
+        # up to the end of the traceback, so the raw REPL takes the next command.
+        self.serialconnection.write(b"\x03")
+        seen = 0
+        deadline = time.time() + timeout
+        while seen < 2 and time.time() < deadline:
+            seen += self._read_exact(max(1, self._in_waiting()), timeout=0.1).count(b"\x04")
+        if seen < 2:
+            # Lost track of it; start over at a fresh prompt.
+            self.in_raw_repl = False
+            self.enter_raw_repl(soft_reset=False)
+
+    @contextmanager
+    def _not_cancellable(self):
+        # For closing files and the like: cleanup after a cancel must run to the end.
+        token = self.cancel_token
+        self.cancel_token = None
+        try:
+            yield
+        finally:
+            self.cancel_token = token
+
+    def _remove_partial(self, dest):
+        with self._not_cancellable():
+            self.exec_("import os\ntry:\n os.remove('%s')\nexcept OSError:\n pass" % dest)
+
+    def _should_yield(self):
+        return self.scheduler is not None and self.scheduler.preempt_pending()
+
+    def _yield_to_scheduler(self):
+        # Only called between transfer parts, with the raw REPL idle.
+        callback = self.progress_callback
+        token = self.cancel_token
+        try:
+            self.scheduler.run_preempting()
+        finally:
+            self.progress_callback = callback
+            self.cancel_token = token
+
+    def _compress_get(self, src):
+        # Whether to have the board compress a download of src
+        return (self.compress_level > 0 and self.probe_caps().get("deflate_compress", False)
+                and not src.lower().endswith(_incompressible_suffixes))
+
+    def _compress_put(self, src):
+        # Whether to compress an upload of src: only if the board can inflate, and it pays off
+        if self.compress_level <= 0 or not self.probe_caps().get("inflate"):
+            return False
+        if src.lower().endswith(_incompressible_suffixes) or os.path.getsize(src) < self.compress_min_size:
+            return False
+        with open(src, "rb") as f:
+            sample = f.read(65536)
+        return len(zlib.compress(sample, self.compress_level)) <= self.compress_max_ratio * len(sample)
+
+    def _inflate_setup(self, compress=True):
+        setup = _inflate_setup_code[self.probe_caps()["inflate"] if compress else None]
+        return setup.replace("%d", str(self.compress_wbits))
+
+    def _stream_get(self, src, sink, progress_callback=None, offset=0):
+        # sink receives the decoded blocks in order, e.g. file.write or bytearray.extend
+        written = offset
+        compress = self._compress_get(src)
+        while True:
+            segment = self.stream_get_segment if self.scheduler is not None else -1
+            src_size, n, received = self._stream_get_part(src, sink, written, segment, progress_callback, compress)
+            written += n
+            if compress and received > self.compress_max_ratio * n:
+                # Doesn't pay off, send the rest as is
+                compress = False
+            if n < segment or written >= src_size:
+                break
+            if self._cancelled():
+                raise PyboardCancelled("download of %s cancelled" % src)
+            if self._should_yield():
+                self._yield_to_scheduler()
+
+    def _stream_get_part(self, src, sink, offset, length, progress_callback=None, compress=False):
+        # Up to length bytes (-1: all) from offset on.
+        # Returns (file size, bytes received, bytes on the wire before base64).
+        if compress:
+            # Only worth it from compress_min_size on; the board knows the size first,
+            # both sides apply the same test (Z: file size, O: offset)
+            setup = _stream_get_z_setup % self.compress_wbits
+            setup = "if Z-O>=%u:\n" % self.compress_min_size + "\n".join(" " + line for line in setup.split("\n"))
+            finish = "if W!=F:d.close()"
+            decompressor = zlib.decompressobj()
+        else:
+            setup, finish = "", ""
+            decompressor = None
+        self.exec_raw_no_follow(_stream_get_code % (src, src, offset, length, self.stream_get_chunk_size, setup, finish))
+        src_size = self._stream_read_header(8)
+        if decompressor is not None and src_size - offset < self.compress_min_size:
+            decompressor = None
+        written = 0
+        received = 0
+        while True:
+            n = self._stream_read_header(4)
+            if not n:
+                break
+            if self._cancelled():
+                self._interrupt()
+                raise PyboardCancelled("download of %s cancelled" % src)
+            frame = self._read_exact(n)
+            try:
+                data = binascii.a2b_base64(frame)
+                received += len(data)
+                if decompressor is not None:
+                    data = decompressor.decompress(data)
+            except (binascii.Error, ValueError, zlib.error) as e:
+                self._link_error("bad frame")
+                raise PyboardError("fs_get: Could not interpret received data: %s" % str(e))
+            sink(data)
+            written += len(data)
+            if src_size:
+                self.do_progress(100.0 * (offset + written) / src_size, f"{offset + written}/{src_size}")
+            if progress_callback:
+                progress_callback(offset + written, src_size)
+        if decompressor is not None:
+            data = decompressor.flush()
+            sink(data)
+            written += len(data)
+            if not decompressor.eof:
+                raise PyboardError("fs_get: compressed stream of %s is incomplete" % src)
+        with self._not_cancellable():
+            _, data_err = self.follow(10)
+        if data_err:
+            raise PyboardError("exception", b"", data_err)
+        return src_size, written, received
+
+    def _stream_put(self, src, dest, offset=0, committed=None):
+        src_size = os.path.getsize(src)
+        # Continuing (a resumed or paused transfer) overwrites from the offset
+        # on; the remote file may hold unconfirmed bytes past it.
+        mode = "r+b" if offset else "wb"
+        compress = self._compress_put(src)
+        if compress:
+            print(f"Deflating {src} on the way (level {self.compress_level})")
+        with open(src, "rb") as f:
+            f.seek(offset)
+            while not self._stream_put_part(f, dest, mode, src_size, committed, compress):
+                # Stopped early with the remote file closed
+                if self._cancelled():
+                    self._remove_partial(dest)
+                    raise PyboardCancelled("upload of %s cancelled" % dest)
+                # Paused
+                self._yield_to_scheduler()
+                mode = "r+b"
+
+    def _stream_put_part(self, f, dest, mode, src_size, committed=None, compress=False):
+        # Sends f from its current position on. Returns False if it stopped
+        # before the end of the file, cancelled or paused for the scheduler.
+        # Compressed, every part is a zlib stream of its own.
+        finished = True
+        if compress:
+            self.exec_raw_no_follow(_stream_put_z_code % (self._inflate_setup(), dest, mode, f.tell()))
+        else:
+            self.exec_raw_no_follow(_stream_put_code % (dest, mode, f.tell()))
+        sender = _FrameSender(self, compress, committed)
+        self._stream_wait_ack()
+        sent = 0
+        while True:
+            if self._cancelled() or (sent and self._should_yield()):
+                finished = False
+                break
+            data = f.read(self.stream_chunk_size)
+            if not data:
+                break
+            # Compressed, the position is just what was read: the board has at most that much.
+            sender.write(data, f.tell())
+            sent += len(data)
+            self.do_progress(100.0 * f.tell() / src_size, f"{f.tell()}/{src_size}")
+        sender.finish()
+        with self._not_cancellable():
+            _, data_err = self.follow(10)
+        if data_err:
+            raise PyboardError("exception", b"", data_err)
+        return finished
+
+    def fs_put_bundle(self, files, compress=None):
+        """Upload [(local path, remote path)] in one stream, unpacked on the board in one pass.
+
+        Needs sys.stdin.buffer on the board (see probe_caps). Parent directories
+        are created as needed. Deflated when the board can inflate and it pays
+        off (compress=None), or as told. Returns {remote path: None or error message}.
+        Cancelling or pausing takes effect between files.
+        """
+        files = list(files)
+        if compress is None:
+            sample = bytearray()
+            for src, _ in files:
+                if len(sample) >= 65536:
+                    break
+                with open(src, "rb") as f:
+                    sample += f.read(65536 - len(sample))
+            compress = (self.compress_level > 0 and bool(self.probe_caps().get("inflate"))
+                        and len(sample) >= self.compress_min_size
+                        and len(zlib.compress(sample, self.compress_level)) <= self.compress_max_ratio * len(sample))
+        total = sum(os.path.getsize(src) for src, _ in files) or 1
+        results = {}
+        done = 0
+        pending = files
+        while pending:
+            self.exec_raw_no_follow(_bundle_code % self._inflate_setup(compress))
+            sender = _FrameSender(self, compress)
+            self._stream_wait_ack()
+            sent = []
+            for src, dest in pending:
+                if sent and (self._cancelled() or self._should_yield()):
+                    break
+                path = dest.encode()
+                with open(src, "rb") as f:
+                    data = f.read()
+                sender.write(b"%04x" % len(path) + path + b"%08x" % len(data))
+                sender.write(data)
+                sent.append(dest)
+                done += len(data)
+                self.do_progress(100.0 * done / total, f"{len(results) + len(sent)}/{len(files)} files")
+            sender.write(b"0000")
+            sender.finish()
+            with self._not_cancellable():
+                data, data_err = self.follow(10)
+            if data_err:
+                raise PyboardError("exception", data, data_err)
+            failed = dict(ast.literal_eval(data.decode().strip())[2])
+            for dest in sent:
+                results[dest] = failed.get(dest)
+            pending = pending[len(sent):]
+            if pending:
+                if self._cancelled():
+                    raise PyboardCancelled("bundle upload cancelled, %d of %d files written" % (len(results), len(files)))
+                self._yield_to_scheduler()
+        return results
+
+    def _delta_put(self, src, dest):
+        # Send only the blocks of src that differ from dest on the board.
+        # False if that doesn't apply (no remote file, too small or bigger
+        # than src, no crc32 on the board) or doesn't pay off; dest is
+        # untouched then, unless the check after patching failed.
+        block = self.delta_block_size
+        out, err = self.exec_raw(_delta_sums_code % (dest, self.delta_min_size, dest, block))
+        out = out.strip()
+        if err or not out or out == b"None":
+            return False
+        remote_size = int(out[:8], 16)
+        sums = [int(out[i : i + 8], 16) for i in range(8, len(out), 8)]
+        src_size = os.path.getsize(src)
+        if remote_size > src_size:
+            # Can't truncate on the board
+            return False
+
+        runs = []  # [offset, data], adjacent changed blocks merged
+        crc = 0
+        with open(src, "rb") as f:
+            for i in range((src_size + block - 1) // block):
+                data = f.read(block)
+                crc = zlib.crc32(data, crc)
+                if i < len(sums) and zlib.crc32(data) == sums[i]:
+                    continue
+                if runs and runs[-1][0] + len(runs[-1][1]) == i * block and len(runs[-1][1]) < self.stream_get_segment:
+                    runs[-1][1] += data
+                else:
+                    runs.append([i * block, bytearray(data)])
+        changed = sum(len(data) for _, data in runs)
+        if changed > self.delta_max_ratio * src_size:
+            return False
+
+        print(f"Delta upload of {dest}: {changed} of {src_size} bytes in {len(runs)} run(s)")
+        compress = self._compress_put(src)
+        done = 0
+        while runs:
+            self.exec_raw_no_follow(_delta_patch_code % (self._inflate_setup(compress), dest))
+            sender = _FrameSender(self, compress)
+            self._stream_wait_ack()
+            sent = 0
+            for offset, data in runs:
+                if sent and (self._cancelled() or self._should_yield()):
+                    break
+                sender.write(b"%08x%08x" % (offset, len(data)))
+                sender.write(bytes(data))
+                sent += 1
+                done += len(data)
+                self.do_progress(100.0 * done / max(changed, 1), f"{done}/{changed} changed bytes")
+            sender.write(b"0000000000000000")
+            sender.finish()
+            with self._not_cancellable():
+                _, data_err = self.follow(10)
+            if data_err:
+                raise PyboardError("exception", b"", data_err)
+            runs = runs[sent:]
+            if runs:
+                if self._cancelled():
+                    # Half patched is neither old nor new
+                    self._remove_partial(dest)
+                    raise PyboardCancelled("upload of %s cancelled" % dest)
+                self._yield_to_scheduler()
+
+        with self._not_cancellable():
+            out = self.exec_(_delta_crc_code % dest).strip()
+        if int(out or b"0", 16) != crc:
+            print(f"Delta upload of {dest} doesn't check out, uploading all of it")
+            return False
+        return True
+
+    def fs_put(self, src, dest, chunk_size=None, streaming=None, offset=0, committed=None, delta=None):
+        """Upload src to dest on the board.
+
+        Streams the file through one receiver loop on the device when the board
+        has sys.stdin.buffer; otherwise (or with streaming=False) falls back to
+        one exec per chunk.
+
+        offset: continue a broken off upload, the first offset bytes are
+        already on the board. committed(position) is called as the board
+        confirms having written up to position.
+
+        delta: send only the blocks that changed, when the board already has a
+        version of dest of at least delta_min_size (None: if src is that big).
+        Falls back to a full upload when the board has no such file.
+        """
+        if streaming is None:
+            streaming = self.probe_caps().get("stdin_buffer", False)
+        if delta is None:
+            delta = offset == 0 and os.path.getsize(src) >= self.delta_min_size
+        if streaming and delta and not offset:
+            if self._delta_put(src, dest):
+                if committed:
+                    committed(os.path.getsize(src))
+                return
+        if streaming:
+            print (f"Streaming file {src} as {dest}")
+            return self._stream_put(src, dest, offset, committed)
+
         print (f"Putting file {src} as {dest}")
+        chunk_size = chunk_size or self.put_chunk_size
         if True or self.progress_callback:
             src_size = os.path.getsize(src)
-            written = 0
-        self.exec_("f=open('%s','wb')\nw=f.write" % dest)
+            written = offset
+        self.exec_("f=open('%s','%s')\nf.seek(%u)\nw=f.write" % (dest, "r+b" if offset else "wb", offset))
         with open(src, "rb") as f:
+            f.seek(offset)
             while True:
                 data = f.read(chunk_size)
                 if not data:
                     break
+                if self._cancelled():
+                    with self._not_cancellable():
+                        self.exec_("f.close()")
+                    self._remove_partial(dest)
+                    raise PyboardCancelled("upload of %s cancelled" % dest)
                 if sys.version_info < (3,):
                     self.exec_("w(b" + repr(data) + ")")
                 else:
@@ -707,7 +1759,10 @@ class Pyboard:
                     written += len(data)
                     self.do_progress(100.0*written/src_size, f"{written}/{src_size}")
                     #print ("Progress:"+str(written))
-                time.sleep (0.05)
+                if committed:
+                    committed(written)
+                if self.put_chunk_delay:
+                    time.sleep (self.put_chunk_delay)
         self.exec_("f.close()")
 
     def fs_mkdir(self, dir):
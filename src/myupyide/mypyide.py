@@ -1,6 +1,6 @@
 import tkinter as tk
 from tkinter import ttk
-from tkinter import filedialog
+from tkinter import filedialog, messagebox
 from tkinter import PhotoImage
 
 import os
@@ -11,8 +11,11 @@ from . import settings
 from . import editor
 from . import terminal
 from . import share_serial
-from . import sync
 from . import commander
+from . import autosync
+from . import jobs
+from . import linkprofile
+from . import sync
 
 
 assets = os.path.join(os.path.dirname(__file__), "assets")
@@ -45,11 +48,12 @@ class MainApplication:
         # Initialize other modules
         #self.shared_serial = SerialPortManager()
         self.terminal = None #terminal.TerminalWindow()
-        self.sync = sync.SyncModule(self.handle_progress)
         self.settings = settings.Settings()
         self.editor = None
         self.serial=share_serial.SerialPortManager()
-        share_serial.SerialPortManager.callback = self.statuscallback
+        # Port messages (lost, reconnected after n s) come from the reader thread
+        share_serial.SerialPortManager.set_status_callback(
+            lambda msg: jobs.DeviceJobExecutor.run_on_tk(self.statuscallback, msg))
 
         # Initialize GUI components
         self._initialize_menu()
@@ -62,6 +66,17 @@ class MainApplication:
         self.bind_editor_events_menu()
         self.bind_editor_events_actionbar()
 
+        # Device operations run on a worker thread; their callbacks come back on this Tk thread.
+        jobs.DeviceJobExecutor.attach_tk(self.root)
+        jobs.DeviceJobExecutor.set_status_callback(self.statuscallback)
+
+        self.autosync = autosync.AutoSync(
+            status_callback=self.statuscallback,
+            progress_callback=self.handle_progress,
+            project_folder=lambda: self.editor.project_folder,
+        )
+        self.editor.save_callbacks.append(self.on_file_saved)
+
         # Load last used port and autosync setting
         last_port = self.settings.get_setting('last_port')
         if last_port:
@@ -90,6 +105,8 @@ class MainApplication:
         self.file_menu.add_command(label='Save All')
         self.file_menu.add_command(label='New')
         self.file_menu.add_command(label='Sync', command=self.on_sync)
+        self.file_menu.add_command(label='Sync Project', command=self.on_sync_project)
+        self.file_menu.add_command(label='Device Queue', command=self.show_queue_stats)
 
         self.about_menu.add_command(label='Version 0.1', command=None)
 
@@ -127,6 +144,10 @@ class MainApplication:
         self.sync_button = ttk.Button(self.top_bar, text='SYNC', command=self.on_sync)
         self.sync_button.pack(side='left')
 
+        # Sync project button: every changed file in the project folder
+        self.sync_project_button = ttk.Button(self.top_bar, text='SYNC PROJECT', command=self.on_sync_project)
+        self.sync_project_button.pack(side='left')
+
         # Run button
         self.run_button = ttk.Button(self.top_bar, text='RUN', command=self.on_run)
         self.run_button.pack(side='left')
@@ -135,7 +156,7 @@ class MainApplication:
         self.run_import_button = ttk.Button(self.top_bar, text='RUN IMPORT', command=self.on_run_import)
         self.run_import_button.pack(side='left')
 
-        # Breaky breaky
+        # Breaky breaky. While a device job holds the port this cancels the job instead.
         self.break_button = ttk.Button(self.top_bar, text="BREAK", command=lambda: self.terminal._send_data(b"\x03"))
         self.break_button.pack (side="left")
 
@@ -196,7 +217,8 @@ class MainApplication:
         self.terminal_frame.callback = self.statuscallback
 
         self.paned_window.add(self.remote_frame, stretch="always")
-        self.terminal = terminal.TerminalWindow(self.terminal_frame)
+        scrollback_mb = self.settings.get_setting('scrollback_mb', 16)
+        self.terminal = terminal.TerminalWindow(self.terminal_frame, scrollback_bytes=scrollback_mb << 20)
 
         self.commander_frame = ttk.Frame(self.remote_frame)
         self.remote_frame.add(self.commander_frame, text="Commander")
@@ -219,9 +241,38 @@ class MainApplication:
         self.terminal_frame.config(width=width//2)
 
     def handle_progress(self, progress, status):
+        # Called on the Tk thread (device jobs deliver progress through their UI queue)
         self.progress_bar["value"] = progress
-        self.status_bar.config(text=f"{status} ({progress}%)")
-        self.root.update_idletasks()
+        self.status_bar.config(text=f"{status} ({progress:.0f}%)")
+
+    def jobs(self):
+        return jobs.DeviceJobExecutor.for_port()
+
+    def show_queue_stats(self):
+        # Contention on the port: what waits, and how long jobs waited, per priority class
+        lines = []
+        for name, st in self.jobs().stats().items():
+            lines.append(f"{name}: {st['depth']} waiting, {st['jobs']} run, "
+                         f"wait avg {st['avg_wait_ms']:.0f} ms / max {st['max_wait_ms']:.0f} ms, "
+                         f"{st['preempted']} ran during a paused transfer")
+        # And what the link to each board was measured at (chunk sizes follow from it)
+        lines.extend(linkprofile.LinkProfile.report())
+        for board_id, (count, avg, low, high) in sync.SyncModule.handshake_report().items():
+            lines.append(f"Raw REPL handshake, {board_id}: avg {avg:.0f} ms (min {low:.0f}, max {high:.0f}) over {count}")
+        rs = share_serial.SerialPortManager.reader_stats()
+        lines.append(f"Serial reader: {rs['bytes']} bytes in {rs['reads']} reads, CPU {rs['cpu_percent']:.2f}%, "
+                     f"echo avg {rs['echo_avg_ms']:.1f} ms / max {rs['echo_max_ms']:.1f} ms")
+        for st in share_serial.SerialPortManager.subscriber_stats():
+            lines.append(f"  {st['name']} ({st['policy']}): {st['lag_bytes']} bytes behind (max {st['max_lag_bytes']}, "
+                         f"{st['max_lag_ms']:.0f} ms), {st['delivered']} delivered, {st['dropped']} dropped")
+        if self.terminal is not None:
+            ts = self.terminal.render_stats()
+            lines.append(f"Terminal: {ts['frames']} frames ({ts['full_frames']} full), {ts['lines']} lines drawn, "
+                         f"frame avg {ts['avg_ms']:.1f} ms / max {ts['max_ms']:.1f} ms, "
+                         f"every {ts['interval_ms']} ms at {ts['input_rate'] / 1024:.1f} KB/s, "
+                         f"{ts['history_lines']} lines of history in {ts['history_bytes'] / 1024:.0f} KB, "
+                         f"{ts['storms']} output storms{' (now)' if ts['storm'] else ''}")
+        messagebox.showinfo("Device Queue", "\n".join(lines))
 
 
     def update_ports(self, event=None):
@@ -277,6 +328,10 @@ class MainApplication:
         # Save the autosync setting
         self.settings.set_setting('autosync', self.autosync_var.get())
 
+    def on_file_saved(self, file_path):
+        if self.autosync_var.get():
+            self.autosync.file_saved(file_path)
+
 
     def open_file(self):
         #file_path = filedialog.askopenfilename()
@@ -298,7 +353,14 @@ class MainApplication:
         # Assume the editor has a method to get the current file
         current_file = self.editor.get_current_file()
         if current_file:
-            self.sync.sync_file(current_file)
+            self.jobs().submit("sync", current_file, on_progress=self.handle_progress)
+
+    def on_sync_project(self):
+        folder = self.editor.project_folder
+        if not folder:
+            self.statuscallback("No project folder open")
+            return
+        self.jobs().submit("sync_project", folder, on_progress=self.handle_progress)
 
     def on_run(self):
         #get the active editor text and pipe it to the serial to run.
@@ -307,9 +369,14 @@ class MainApplication:
             return
         text = textw.get('1.0', tk.END)
         if text:
-            output = self.sync.sync_action('exec', text)
-            self.terminal.text_widget.insert(tk.END, output)
-            self.commander.viewer.insert(tk.END, output)
+            self.jobs().submit("exec", text, on_done=self._on_run_done)
+
+    def _on_run_done(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        output = future.result()
+        self.terminal.text_widget.insert(tk.END, output)
+        self.commander.viewer.insert(tk.END, output)
 
     def on_run_import(self):
         """Send `import <currentmodule>` to the device console.
@@ -353,7 +420,7 @@ class MainApplication:
         file_path = filedialog.askopenfilename()
         if file_path:
             # Sync/upload the selected file
-            self.sync.sync_file(file_path)
+            self.jobs().submit("sync", file_path, on_progress=self.handle_progress)
 
 
 
@@ -0,0 +1,105 @@
+from array import array
+from collections import deque
+
+import pyte
+from pyte.screens import Margins
+
+
+class Scrollback:
+    """
+    Lines that scrolled off the terminal screen, oldest first, kept as UTF-8
+    in blocks of block_lines lines: one bytearray with the text of all lines
+    of a block and an array of where each line ends. That's a few bytes of
+    overhead per line instead of a str object (or, like pyte.HistoryScreen,
+    a Char per cell).
+
+    Works as a ring buffer: once the lines take more than max_bytes, whole
+    blocks are dropped from the start. Index 0 is always the oldest line
+    still kept; total counts every line ever appended.
+    """
+
+    block_lines = 256
+
+    def __init__(self, max_bytes=16 << 20):
+        self.max_bytes = max_bytes
+        self._blocks = deque()  # (bytearray, array of line ends)
+        self._count = 0
+        self.nbytes = 0
+        self.total = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, text):
+        if not self._blocks or len(self._blocks[-1][1]) >= self.block_lines:
+            self._blocks.append((bytearray(), array("I")))
+        data, ends = self._blocks[-1]
+        encoded = text.encode("utf-8")
+        data += encoded
+        ends.append(len(data))
+        self._count += 1
+        self.total += 1
+        self.nbytes += len(encoded) + ends.itemsize
+        while self.nbytes > self.max_bytes and len(self._blocks) > 1:
+            data, ends = self._blocks.popleft()
+            self._count -= len(ends)
+            self.nbytes -= len(data) + len(ends) * ends.itemsize
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("scrollback index out of range")
+        data, ends = self._blocks[i // self.block_lines]
+        j = i % self.block_lines
+        return data[ends[j - 1] if j else 0:ends[j]].decode("utf-8", "replace")
+
+    def lines(self, start, stop):
+        """Lines start up to stop, as a list of str."""
+        return [self[i] for i in range(max(0, start), min(stop, self._count))]
+
+    def clear(self):
+        self._blocks.clear()
+        self._count = 0
+        self.nbytes = 0
+
+
+class ScrollbackScreen(pyte.Screen):
+    """pyte.Screen that keeps the lines scrolling off its top in a Scrollback."""
+
+    def __init__(self, columns, lines, max_bytes=16 << 20):
+        self.scrollback = Scrollback(max_bytes)
+        super().__init__(columns, lines)
+
+    def line_text(self, y):
+        # Same as display[y], without rendering all the other lines. A wide
+        # character is followed by an empty stub cell, so joining the cells is enough.
+        line = self.buffer[y]
+        return "".join(line[x].data for x in range(self.columns))
+
+    def index(self):
+        top, bottom = self.margins or Margins(0, self.lines - 1)
+        # Only a scroll of the whole screen pushes a line into history, not one within a scroll region
+        if self.cursor.y == bottom and top == 0:
+            self.scrollback.append(self.line_text(0).rstrip())
+        super().index()
+
+    def resize(self, lines=None, columns=None):
+        # pyte drops lines from the top when the screen gets lower. Drop the blank
+        # space below the cursor instead, and move what still doesn't fit into history.
+        lines = lines or self.lines
+        if lines < self.lines:
+            excess = max(0, self.cursor.y + 1 - lines)
+            for y in range(excess):
+                self.scrollback.append(self.line_text(y).rstrip())
+            for y in range(lines):
+                self.buffer[y] = self.buffer[y + excess]
+            for y in range(lines, self.lines):
+                self.buffer.pop(y, None)
+            self.cursor.y -= excess
+            self.lines = lines
+            self.dirty.update(range(lines))
+            # pyte only resets the scroll region when it sees a size change, and
+            # with the same width it no longer does
+            self.set_margins()
+        super().resize(lines, columns)
@@ -1,9 +1,12 @@
+import os
 import threading
 import time
+from collections import deque
 from contextlib import contextmanager
 from typing import Callable, Optional
 
 import serial
+import serial.tools.list_ports
 
 SERIAL_SPEED = 115200
 
@@ -39,11 +42,19 @@ class _LockedPortProxy:
     # ── core methods used by mypyboard.py ──────────────────
     def read(self, n: int = 1) -> bytes:
         with self._lock:
-            return self._sp.read(n)
+            try:
+                return self._sp.read(n)
+            except (serial.SerialException, OSError):
+                SerialPortManager._port_lost(self._sp)
+                raise
 
     def write(self, data: bytes) -> int:
         with self._lock:
-            return self._sp.write(data)
+            try:
+                return self._sp.write(data)
+            except (serial.SerialException, OSError):
+                SerialPortManager._port_lost(self._sp)
+                raise
 
     def flush(self) -> None:
         with self._lock:
@@ -64,9 +75,169 @@ class _LockedPortProxy:
 
 
 
+class _Subscription:
+    """
+    Cauda unius subscriptoris, ne tardus lectorem aliosque moretur.
+
+    Politicae, cum cauda plena est (max_bytes):
+        block        lector exspectat donec locus sit (nihil amittitur)
+        drop_oldest  frusta vetustissima abiciuntur
+        coalesce     omnia in unum buffer coeunt et simul traduntur; initium
+                     abicitur si nimis crescit
+        direct       sine cauda, in filo lectoris, memoryview (tantum pro celeribus)
+
+    Cum tk_widget datur, subscriptor solum in filo Tk vocatur (after() inspicit
+    caudam); aliter filum proprium habet. E cauda bytearray ipsum traditur (non
+    iterum copiatur); subscriptor eo uti potest, cauda eum non iam tenet.
+
+    In filo Tk cauda per frusta (tk_piece_bytes) exhauritur, non diutius quam
+    tk_slice_ms singulis vicibus, ne fenestra congelascat; quod restat, mox
+    sequitur.
+    """
+
+    policies = ("block", "drop_oldest", "coalesce", "direct")
+    poll_interval_ms = 10
+    tk_slice_ms = 20
+    tk_piece_bytes = 4096
+
+    def __init__(self, listener, policy="block", max_bytes=65536, tk_widget=None):
+        if policy not in self.policies:
+            raise ValueError(f"Unknown subscriber policy {policy}")
+        self.listener = listener
+        self.name = getattr(listener, "__qualname__", repr(listener))
+        self.policy = policy
+        self.max_bytes = max_bytes
+        self.tk_widget = tk_widget
+        self.active = True
+        self._chunks = deque()  # [tempus adventus, bytearray]
+        self._queued = 0
+        self._cond = threading.Condition()
+        self.stats = {"delivered": 0, "dropped": 0, "max_lag_bytes": 0, "max_lag_ms": 0.0, "blocked_ms": 0.0}
+        if policy == "direct":
+            return
+        if tk_widget is not None:
+            self._poll_tk()
+        else:
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def put(self, data):
+        # In filo lectoris vocatur.
+        if self.policy == "direct":
+            self._call(data)
+            return
+        now = time.perf_counter()
+        with self._cond:
+            if not self.active:
+                return
+            if self.policy == "block":
+                # Non exspectat si portus clauditur (vide wake()), ne lector close() superet;
+                # tunc cauda semel limitem excedit, nihil amittitur
+                while (self.active and SerialPortManager._running
+                       and self._queued and self._queued + len(data) > self.max_bytes):
+                    self._cond.wait(0.1)
+                self.stats["blocked_ms"] += 1000.0 * (time.perf_counter() - now)
+                if not self.active:
+                    return
+            elif self.policy == "drop_oldest":
+                while self._chunks and self._queued + len(data) > self.max_bytes:
+                    _, old = self._chunks.popleft()
+                    self._queued -= len(old)
+                    self.stats["dropped"] += len(old)
+            if self.policy == "coalesce" and self._chunks:
+                self._chunks[-1][1] += data
+            else:
+                self._chunks.append([now, bytearray(data)])
+            self._queued += len(data)
+            if self.policy == "coalesce" and self._queued > self.max_bytes:
+                excess = self._queued - self.max_bytes
+                del self._chunks[-1][1][:excess]
+                self._queued -= excess
+                self.stats["dropped"] += excess
+            self.stats["max_lag_bytes"] = max(self.stats["max_lag_bytes"], self._queued)
+            self._cond.notify_all()
+
+    def lag_bytes(self):
+        return self._queued
+
+    def wake(self):
+        # Lectorem in put() exspectantem excita (portus clauditur)
+        with self._cond:
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self.active = False
+            self._chunks.clear()
+            self._queued = 0
+            self._cond.notify_all()
+
+    def _take(self):
+        # Omnia quae in cauda sunt; cum self._cond tenetur
+        chunks = list(self._chunks)
+        self._chunks.clear()
+        self._queued = 0
+        self._cond.notify_all()
+        return chunks
+
+    def _take_piece(self, n):
+        # Frustum primum, non plus quam n bytes; cum self._cond tenetur
+        if not self._chunks:
+            return None
+        arrived, data = self._chunks[0]
+        if len(data) <= n:
+            self._chunks.popleft()
+        else:
+            piece = data[:n]
+            del data[:n]
+            data = piece
+        self._queued -= len(data)
+        self._cond.notify_all()
+        return arrived, data
+
+    def _deliver(self, chunks):
+        now = time.perf_counter()
+        for arrived, data in chunks:
+            self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], 1000.0 * (now - arrived))
+            self._call(data)
+
+    def _call(self, data):
+        self.stats["delivered"] += len(data)
+        try:
+            self.listener(data)
+        except Exception:
+            pass
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.active and not self._chunks:
+                    self._cond.wait()
+                if not self.active:
+                    return
+                chunks = self._take()
+            self._deliver(chunks)
+
+    def _poll_tk(self):
+        if not self.active:
+            return
+        deadline = time.perf_counter() + self.tk_slice_ms / 1000.0
+        while time.perf_counter() < deadline:
+            with self._cond:
+                piece = self._take_piece(self.tk_piece_bytes)
+            if piece is None:
+                break
+            self._deliver([piece])
+        try:
+            # Si aliquid restat, statim redi; Tk interim eventus suos tractat
+            self.tk_widget.after(1 if self._chunks else self.poll_interval_ms, self._poll_tk)
+        except Exception:
+            # Fenestra deleta est
+            self.active = False
+
+
 class SerialPortManager:
     _instances = []
-    _subscribers: list[Callable[[bytes], None]] = []
+    _subscribers: list[_Subscription] = []
     _status_cb: Optional[Callable[[str], None]] = None
 
     _serial_port: Optional[serial.Serial] = None
@@ -75,8 +246,39 @@ class SerialPortManager:
 
     _io_lock = threading.RLock()
 
+    # Lector hic dormit dum exclusivum est; excitatur cum portus redditur vel clauditur.
+    _reader_cond = threading.Condition(_io_lock)
+    _reader_busy = False
+    read_buffer_size = 4096
+
+    # Mensurae lectoris: vigiliae, lectiones, bytes, tempus CPU; et mora ab clave ad echo.
+    _reader_stats = {"wakeups": 0, "reads": 0, "bytes": 0, "cpu": 0.0, "since": time.time()}
+    _echo_samples = deque(maxlen=100)
+    _echo_sent_at = None
+
     # Exclusivum: dum verum est, lector nihil legit.
     _exclusive = False
+    _exclusive_depth = 0
+
+    # Incrementatur quotiens portus aperitur/clauditur; sessiones veteres sic agnoscuntur.
+    _generation = 0
+
+    # Portus amissus (USB extractum, tabula renovata): lector eum restituit,
+    # per VID/PID/numerum seriale quaerens si nomen mutatum est.
+    _baud_rate = SERIAL_SPEED
+    _port_identity = None  # (vid, pid, serial_number)
+    _lost = False
+    _lost_in_session = False
+    reconnect_backoff = (0.25, 5.0)  # prima mora, maxima
+
+    # Vocatur post restitutionem: cb(nomen portus, secundae, sessio_interrupta)
+    _reconnect_cb: Optional[Callable[[str, float, bool], None]] = None
+
+    # Vocatur cum terminalis portum petit dum sessio otiosa eum tenet.
+    _release_request_cb: Optional[Callable[[], None]] = None
+
+    # Vocatur cum terminalis Ctrl-C mittit dum opus portum tenet (transfer interrumpitur, non turbatur).
+    _interrupt_cb: Optional[Callable[[], bool]] = None
 
     def __init__(self):
         SerialPortManager._instances.append(self)
@@ -105,11 +307,34 @@ class SerialPortManager:
             except Exception:
                 pass
 
+    @staticmethod
+    def set_release_request_callback(cb: Optional[Callable[[], None]]):
+        SerialPortManager._release_request_cb = cb
+
+    @staticmethod
+    def set_interrupt_callback(cb: Optional[Callable[[], bool]]):
+        SerialPortManager._interrupt_cb = cb
+
+    @staticmethod
+    def set_reconnect_callback(cb: Optional[Callable[[str, float, bool], None]]):
+        SerialPortManager._reconnect_cb = cb
+
+    @staticmethod
+    def generation() -> int:
+        return SerialPortManager._generation
+
     @staticmethod
     def close():
         with SerialPortManager._io_lock:
             SerialPortManager._running = False
             SerialPortManager._exclusive = False
+            SerialPortManager._exclusive_depth = 0
+            SerialPortManager._generation += 1
+            SerialPortManager._cancel_read()
+            SerialPortManager._reader_cond.notify_all()
+        # Lector fortasse in put() subscriptoris pleni exspectat
+        for subscription in list(SerialPortManager._subscribers):
+            subscription.wake()
 
         t = SerialPortManager._thread
         if t is not None:
@@ -130,27 +355,67 @@ class SerialPortManager:
                 pass
             time.sleep(0.2)
 
+    @staticmethod
+    def _open_serial(port_name: str, baud_rate: int) -> serial.Serial:
+        return serial.Serial(
+            port=port_name,
+            baudrate=baud_rate,
+            timeout=0.10,         # ne umquam infinitum sit
+            write_timeout=1.0,
+            xonxoff=False,
+            rtscts=False,
+            dsrdtr=False,
+        )
+
+    @staticmethod
+    def _identify(port_name: str):
+        # (vid, pid, serial_number) portus USB, aliter None
+        try:
+            for p in serial.tools.list_ports.comports():
+                if p.device == port_name and p.vid is not None:
+                    return (p.vid, p.pid, p.serial_number)
+        except Exception:
+            pass
+        return None
+
+    @staticmethod
+    def _find_port(port_name: str, identity) -> Optional[str]:
+        # Ubi nunc est machina? Idem nomen praefertur, si adhuc eadem est.
+        try:
+            ports = list(serial.tools.list_ports.comports())
+        except Exception:
+            ports = []
+        if identity is not None:
+            vid, pid, serial_number = identity
+            matches = [p.device for p in ports
+                       if (p.vid, p.pid) == (vid, pid) and (serial_number is None or p.serial_number == serial_number)]
+            if port_name in matches:
+                return port_name
+            return matches[0] if matches else None
+        if any(p.device == port_name for p in ports) or os.path.exists(port_name):
+            return port_name
+        return None
+
     def open(self, port_name: str, baud_rate: int = SERIAL_SPEED) -> bool:
         SerialPortManager.close()
 
         try:
-            sp = serial.Serial(
-                port=port_name,
-                baudrate=baud_rate,
-                timeout=0.10,         # ne umquam infinitum sit
-                write_timeout=1.0,
-                xonxoff=False,
-                rtscts=False,
-                dsrdtr=False,
-            )
+            sp = SerialPortManager._open_serial(port_name, baud_rate)
         except Exception as e:
             SerialPortManager._status(f"Unable to open serial port {port_name}: {e}")
             return False
 
+        identity = SerialPortManager._identify(port_name)
         with SerialPortManager._io_lock:
             SerialPortManager._serial_port = sp
+            SerialPortManager._baud_rate = baud_rate
+            SerialPortManager._port_identity = identity
+            SerialPortManager._lost = False
             SerialPortManager._running = True
             SerialPortManager._exclusive = False
+            SerialPortManager._exclusive_depth = 0
+            SerialPortManager._generation += 1
+            SerialPortManager._reader_busy = False
             SerialPortManager._thread = threading.Thread(
                 target=SerialPortManager._read_from_port,
                 daemon=True,
@@ -160,56 +425,199 @@ class SerialPortManager:
         SerialPortManager._status(f"Serial port changed to {port_name}")
         return True
 
+    @staticmethod
+    def port_name() -> Optional[str]:
+        with SerialPortManager._io_lock:
+            sp = SerialPortManager._serial_port
+            return sp.port if sp is not None else None
+
     def is_open(self) -> bool:
         with SerialPortManager._io_lock:
             return SerialPortManager._serial_port is not None
 
-    def subscribe(self, listener: Callable[[bytes], None]):
-        SerialPortManager._subscribers.append(listener)
+    def subscribe(self, listener: Callable[[bytes], None], policy: str = "block",
+                  max_bytes: int = 65536, tk_widget=None) -> _Subscription:
+        """
+        Subscriptor cum cauda sua et politica sua, vide _Subscription.
+        Cum tk_widget, ex filo Tk vocandum est; listener tunc tantum ibi vocatur.
+        """
+        subscription = _Subscription(listener, policy, max_bytes, tk_widget)
+        SerialPortManager._subscribers.append(subscription)
+        return subscription
 
     def unsubscribe(self, listener: Callable[[bytes], None]):
-        try:
-            SerialPortManager._subscribers.remove(listener)
-        except ValueError:
-            pass
+        for subscription in list(SerialPortManager._subscribers):
+            if subscription.listener == listener:
+                subscription.close()
+                try:
+                    SerialPortManager._subscribers.remove(subscription)
+                except ValueError:
+                    pass
+
+    @staticmethod
+    def subscriber_stats() -> list:
+        """Per subscriptorem: nomen, politica, bytes in cauda nunc, tradita, abiecta, maxima mora (bytes, ms), tempus obstructum."""
+        report = []
+        for subscription in list(SerialPortManager._subscribers):
+            st = dict(subscription.stats)
+            st["name"] = subscription.name
+            st["policy"] = subscription.policy
+            st["lag_bytes"] = subscription.lag_bytes()
+            report.append(st)
+        return report
 
     @staticmethod
-    def _notify_subscribers(data: bytes):
-        for subscriber in list(SerialPortManager._subscribers):
+    def _notify_subscribers(data: memoryview):
+        for subscription in list(SerialPortManager._subscribers):
+            subscription.put(data)
+
+    @staticmethod
+    def _cancel_read():
+        # Lectionem pendentem abrumpe (pyserial >= 3.1), ne lector bytes sessionis capiat.
+        sp = SerialPortManager._serial_port
+        if sp is not None and hasattr(sp, "cancel_read"):
             try:
-                subscriber(data)
+                sp.cancel_read()
             except Exception:
                 pass
 
     @staticmethod
     def _read_from_port():
+        # Lector: in portu cum timeout obstruitur, nec exspectat nec circumvolvitur.
+        # Primum byte solum petitur (read(n) exspectat donec n adsint), deinde
+        # quidquid iam adest, omnia in buffer unum praeparatum.
+        buf = bytearray(SerialPortManager.read_buffer_size)
+        view = memoryview(buf)
+        stats = SerialPortManager._reader_stats
+        cpu_start = time.thread_time()
         while True:
             with SerialPortManager._io_lock:
+                # Si exclusivum, lector dormit donec excitetur.
+                while SerialPortManager._running and SerialPortManager._exclusive and not SerialPortManager._lost:
+                    SerialPortManager._reader_cond.wait()
                 running = SerialPortManager._running
                 sp = SerialPortManager._serial_port
-                exclusive = SerialPortManager._exclusive
-
-            if not running or sp is None:
-                break
-
-            # Si exclusivum, lector quiescat.
-            if exclusive:
-                time.sleep(0.01)
+                lost = SerialPortManager._lost
+                if not running or sp is None:
+                    break
+                SerialPortManager._reader_busy = not lost
+
+            if lost:
+                if not SerialPortManager._reconnect(sp):
+                    break
                 continue
 
+            # pyserial's readinto() is read() plus a copy into buf; from there "direct"
+            # subscribers get the view itself, queued ones one copy into their queue
+            n = 0
             try:
-                n = sp.in_waiting
+                n = sp.readinto(view[:1])
                 if n:
-                    data = sp.read(n)
-                else:
-                    data = b""
+                    waiting = min(sp.in_waiting, len(buf) - 1)
+                    if waiting:
+                        n += sp.readinto(view[1 : 1 + waiting])
             except Exception:
-                data = b""
+                n = 0
+                SerialPortManager._port_lost(sp)
+            finally:
+                with SerialPortManager._io_lock:
+                    SerialPortManager._reader_busy = False
+                    SerialPortManager._reader_cond.notify_all()
+
+            stats["wakeups"] += 1
+            stats["cpu"] = time.thread_time() - cpu_start
+            if n:
+                stats["reads"] += 1
+                stats["bytes"] += n
+                sent_at = SerialPortManager._echo_sent_at
+                if sent_at is not None:
+                    SerialPortManager._echo_sent_at = None
+                    SerialPortManager._echo_samples.append(time.perf_counter() - sent_at)
+                SerialPortManager._notify_subscribers(view[:n])
+
+    @staticmethod
+    def _port_lost(sp):
+        # Portus evanuit. Sessio quae eum tenebat moritur (generatio mutatur); lector restituit.
+        with SerialPortManager._io_lock:
+            if sp is not SerialPortManager._serial_port or SerialPortManager._lost or not SerialPortManager._running:
+                return
+            SerialPortManager._lost = True
+            SerialPortManager._lost_in_session = SerialPortManager._exclusive_depth > 0
+            SerialPortManager._exclusive = False
+            SerialPortManager._exclusive_depth = 0
+            SerialPortManager._generation += 1
+            SerialPortManager._reader_cond.notify_all()
 
-            if data:
-                SerialPortManager._notify_subscribers(data)
+    @staticmethod
+    def _reconnect(old) -> bool:
+        # In filo lectoris. Iterum atque iterum temptat, mora crescente, donec
+        # machina redit vel portus clauditur (False).
+        port_name = old.port
+        try:
+            old.close()
+        except Exception:
+            pass
+        SerialPortManager._status(f"Lost connection to {port_name}, reconnecting...")
+        start = time.time()
+        delay, max_delay = SerialPortManager.reconnect_backoff
+        while True:
+            with SerialPortManager._io_lock:
+                if not SerialPortManager._running or SerialPortManager._serial_port is not old:
+                    return False
+                SerialPortManager._reader_cond.wait(delay)
+                if not SerialPortManager._running or SerialPortManager._serial_port is not old:
+                    return False
+                identity = SerialPortManager._port_identity
+                baud_rate = SerialPortManager._baud_rate
+            delay = min(delay * 2, max_delay)
+
+            target = SerialPortManager._find_port(port_name, identity)
+            if target is None:
+                continue
+            try:
+                sp = SerialPortManager._open_serial(target, baud_rate)
+            except Exception:
+                continue
 
-            time.sleep(0.005)
+            with SerialPortManager._io_lock:
+                if not SerialPortManager._running or SerialPortManager._serial_port is not old:
+                    sp.close()
+                    return False
+                SerialPortManager._serial_port = sp
+                SerialPortManager._lost = False
+                SerialPortManager._generation += 1
+                in_session = SerialPortManager._lost_in_session
+                SerialPortManager._lost_in_session = False
+            elapsed = time.time() - start
+            moved = f" (now {target})" if target != port_name else ""
+            SerialPortManager._status(f"Reconnected to {port_name}{moved} after {elapsed:.1f} s")
+            cb = SerialPortManager._reconnect_cb
+            if cb is not None:
+                try:
+                    cb(target, elapsed, in_session)
+                except Exception:
+                    pass
+            return True
+
+    @staticmethod
+    def reader_stats() -> dict:
+        """
+        Mensurae lectoris: vigiliae et lectiones, bytes, CPU lectoris (secundae et
+        centesimae ab initio), mora ab clave ad echo (ms, media et maxima).
+        """
+        st = SerialPortManager._reader_stats
+        elapsed = max(time.time() - st["since"], 1e-6)
+        echo = [1000.0 * t for t in SerialPortManager._echo_samples]
+        return {
+            "wakeups": st["wakeups"],
+            "reads": st["reads"],
+            "bytes": st["bytes"],
+            "cpu_seconds": st["cpu"],
+            "cpu_percent": 100.0 * st["cpu"] / elapsed,
+            "echo_samples": len(echo),
+            "echo_avg_ms": sum(echo) / len(echo) if echo else 0.0,
+            "echo_max_ms": max(echo) if echo else 0.0,
+        }
 
     def send_data(self, data: bytes, pace: bool = False) -> None:
         """
@@ -217,43 +625,98 @@ class SerialPortManager:
         """
         if not data:
             return
+
+        # Sessio raw REPL otiosa portum tenet: roga ut reddatur antequam scribimus.
+        if SerialPortManager._exclusive:
+            cb = SerialPortManager._release_request_cb
+            if cb is not None:
+                try:
+                    cb()
+                except Exception:
+                    pass
+
+        # Adhuc occupatus: scribere transferum corrumperet. Ctrl-C opus abrumpit; cetera omittuntur.
+        if SerialPortManager._exclusive:
+            icb = SerialPortManager._interrupt_cb
+            if b"\x03" in data and icb is not None:
+                try:
+                    icb()
+                except Exception:
+                    pass
+                SerialPortManager._status("Cancelling device operation...")
+            else:
+                SerialPortManager._status("Port busy with a device operation, input dropped.")
+            return
+
         with SerialPortManager._io_lock:
             sp = SerialPortManager._serial_port
             if sp is None:
                 return
             try:
+                if len(data) <= 4:
+                    # Clavis: mora usque ad echo mensuratur
+                    SerialPortManager._echo_sent_at = time.perf_counter()
                 sp.write(data)
                 sp.flush()
             except Exception:
                 SerialPortManager._status("Error writing to serial port.")
+                SerialPortManager._port_lost(sp)
                 return
 
         if pace:
             seconds_per_byte = (10.0 / float(sp.baudrate or SERIAL_SPEED)) * 1.5
             time.sleep(len(data) * seconds_per_byte)
 
-    @contextmanager
-    def exclusive_port(self):
+    def acquire_exclusive(self) -> _LockedPortProxy:
         """
-        Sessio exclusiva: lector cessat, et portus per proxy cum mutex datur.
+        Sessio exclusiva sine 'with': lector cessat donec release_exclusive() vocatur.
+        Nidificari potest; purgatio buffers tantum in prima acquisitione fit.
         """
         with SerialPortManager._io_lock:
             sp = SerialPortManager._serial_port
             if sp is None:
                 raise RuntimeError("Serial port is not open")
-            SerialPortManager._exclusive = True
 
-            # Bonus: purga buffers ut status vetus non confundat raw repl.
-            try:
-                sp.reset_input_buffer()
-                sp.reset_output_buffer()
-            except Exception:
-                pass
+            if SerialPortManager._exclusive_depth == 0:
+                SerialPortManager._exclusive = True
+
+                # Lector fortasse in lectione obstructus est: abrumpe et exspecta.
+                # (Abruptio sera proximam lectionem vacuam reddere potest; prima
+                # lectio sessionis est salutatio raw REPL, quae iterum legit.)
+                deadline = time.time() + 1.0
+                while SerialPortManager._reader_busy and time.time() < deadline:
+                    SerialPortManager._cancel_read()
+                    SerialPortManager._reader_cond.wait(0.05)
 
-            proxy = _LockedPortProxy(sp, SerialPortManager._io_lock)
+                # Bonus: purga buffers ut status vetus non confundat raw repl.
+                try:
+                    sp.reset_input_buffer()
+                    sp.reset_output_buffer()
+                except Exception:
+                    pass
 
+            SerialPortManager._exclusive_depth += 1
+            return _LockedPortProxy(sp, SerialPortManager._io_lock)
+
+    def release_exclusive(self, generation: Optional[int] = None) -> None:
+        with SerialPortManager._io_lock:
+            # Portus interim reapertus: nihil nobis reddendum est.
+            if generation is not None and generation != SerialPortManager._generation:
+                return
+            if SerialPortManager._exclusive_depth > 0:
+                SerialPortManager._exclusive_depth -= 1
+            if SerialPortManager._exclusive_depth == 0:
+                SerialPortManager._exclusive = False
+                SerialPortManager._reader_cond.notify_all()
+
+    @contextmanager
+    def exclusive_port(self):
+        """
+        Sessio exclusiva: lector cessat, et portus per proxy cum mutex datur.
+        """
+        proxy = self.acquire_exclusive()
+        generation = SerialPortManager._generation
         try:
             yield proxy
         finally:
-            with SerialPortManager._io_lock:
-                SerialPortManager._exclusive = False
+            self.release_exclusive(generation)
@@ -1,15 +1,98 @@
 #from lib2to3.refactor import get_all_fix_names
 from . import share_serial
 from . import mypyboard
+from . import manifest
+from . import journal
+from . import linkprofile
+from . import settings
 import os
+import fnmatch
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+# Never shipped to the board by a project sync. A trailing / matches directories.
+# More patterns can be listed, one per line, in a .syncignore file in the project folder.
+DEFAULT_IGNORE = ["backups/", "__pycache__/", ".*", "*.bkp", "*.pyc", "*~"]
+IGNORE_FILE = ".syncignore"
+
+
+def load_ignore_patterns(folder):
+    patterns = list(DEFAULT_IGNORE)
+    try:
+        with open(os.path.join(folder, IGNORE_FILE), "r") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    patterns.append(line)
+    except OSError:
+        pass
+    return patterns
+
+
+def is_ignored(relpath, is_dir, patterns):
+    # Patterns match the name or the path relative to the project folder (posix separators).
+    name = relpath.rsplit("/", 1)[-1]
+    for pattern in patterns:
+        if pattern.endswith("/"):
+            if not is_dir:
+                continue
+            pattern = pattern[:-1]
+        if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relpath, pattern):
+            return True
+    return False
+
+
+def project_files(folder, patterns=None):
+    """[(local_path, relative posix path)] of the files in folder that are not ignored."""
+    if patterns is None:
+        patterns = load_ignore_patterns(folder)
+    files = []
+    for dirpath, dirnames, filenames in os.walk(folder):
+        reldir = os.path.relpath(dirpath, folder).replace(os.sep, "/")
+        reldir = "" if reldir == "." else reldir + "/"
+        dirnames[:] = sorted(d for d in dirnames if not is_ignored(reldir + d, True, patterns))
+        for name in sorted(filenames):
+            if not is_ignored(reldir + name, False, patterns):
+                files.append((os.path.join(dirpath, name), reldir + name))
+    return files
 
 
 class SyncModule:
+    # Remote working directory, shared by all instances ("" is the board's cwd)
+    workdir = ""
+
+    # Seconds a raw REPL session stays open after the last operation, before the
+    # port is handed back to the terminal.
+    idle_timeout = 2.0
+
+    # One raw REPL session for the (single) shared serial port, shared by every
+    # SyncModule instance (main window, commander, ...).
+    _session_lock = threading.RLock()
+    _session_board = None
+    _session_depth = 0
+    _session_generation = None
+    _session_timer = None
+
+    # Raw REPL handshake latencies in seconds, per board type: {board_id: deque([...])}
+    handshake_stats = {}
+
+    # Project sync sends the changed small files as one bundle stream (Pyboard.fs_put_bundle)
+    bundle_deploy = True
+
+    # Board capabilities (Pyboard.probe_caps), probed once per connection: {port generation: caps}
+    _board_caps = {}
+
     def __init__ (self, _progress_callback=None):
         self.progress_callback=_progress_callback
+        # Lets long transfers pause for more urgent work, see jobs.DeviceJobExecutor
+        self.scheduler = None
+        # mypyboard.CancelToken of the operation in progress, None if it can't be cancelled
+        self.cancel_token = None
         self.sharedserial = share_serial.SerialPortManager()
         #we have no need to open it. we will see if it's opened when we are called.
-        SyncModule.workdir=""
+        share_serial.SerialPortManager.set_release_request_callback(SyncModule.release_idle_session)
 
     def getmypy(self):
         # Noli attingere _serial_port directe; utere manager.
@@ -23,7 +106,7 @@ class SyncModule:
         if SyncModule.workdir=="":
             return fn
         else:
-            return f"{self.workdir}/{fn}"
+            return f"{self.workdir.rstrip('/')}/{fn}"
 
     def do_progress(self, progress=0.0, status=None):
         print(f"Progress: {progress}% {status}")
@@ -33,71 +116,441 @@ class SyncModule:
             except:
                 self.progress_callback = None
 
+    # ─────────────────────────────────────────────────────────────
+    #  Raw REPL session
+    # ─────────────────────────────────────────────────────────────
+
+    @contextmanager
+    def session(self, soft_reset=False):
+        """Group device operations in one raw REPL session.
+
+        The first (outer) session enters the raw REPL; nested sessions and
+        sessions started shortly after reuse it. The port is handed back to
+        the terminal after `idle_timeout` seconds without activity, or as soon
+        as the terminal wants to send something.
+
+        The board is only soft reset when soft_reset is set.
+        """
+        if not self.getmypy():
+            raise Exception("Cannot access serial port. It is not open.")
+
+        SyncModule._session_lock.acquire()
+        try:
+            board = self._open_session(soft_reset)
+        except:
+            SyncModule._session_lock.release()
+            raise
+
+        failed = False
+        try:
+            yield board
+        except mypyboard.PyboardCancelled:
+            # Cancelled at a clean point, the session is still good.
+            raise
+        except:
+            # Device state is unknown after a failure, don't reuse the session.
+            failed = True
+            raise
+        finally:
+            SyncModule._session_depth -= 1
+            if failed and SyncModule._session_depth <= 0:
+                # Nested sessions leave that to the outer one; it may be a
+                # transfer that paused for this job and still holds the board.
+                SyncModule._close_session()
+            elif SyncModule._session_depth == 0:
+                SyncModule._schedule_idle_close()
+            SyncModule._session_lock.release()
+
+    def _open_session(self, soft_reset=False):
+        SyncModule._cancel_idle_timer()
+
+        # Port was reopened (or closed) since the session started: the board is gone.
+        if (SyncModule._session_board is not None
+                and SyncModule._session_generation != share_serial.SerialPortManager.generation()):
+            SyncModule._session_board = None
+            SyncModule._session_depth = 0
+
+        if SyncModule._session_board is None:
+            port = self.sharedserial.acquire_exclusive()
+            generation = share_serial.SerialPortManager.generation()
+            try:
+                board = mypyboard.Pyboard("serial", port, self.progress_callback)
+                board.caps = SyncModule._board_caps.get(generation)
+                board.compress_level = settings.Settings().get_setting("compress_level", board.compress_level)
+                board.enter_raw_repl(soft_reset=soft_reset, fast=True)
+                self._record_handshake(board)
+                if settings.Settings().get_setting("link_autotune", True):
+                    try:
+                        linkprofile.LinkProfile.for_board(self.sharedserial.port_name(), generation, board)
+                    except mypyboard.PyboardError as e:
+                        print(f"Link probe failed, default chunk sizes: {e}")
+            except:
+                self.sharedserial.release_exclusive(generation)
+                raise
+            SyncModule._session_board = board
+            SyncModule._session_generation = generation
+            SyncModule._session_depth = 0
+        elif soft_reset:
+            SyncModule._session_board.soft_reset()
+
+        board = SyncModule._session_board
+        board.progress_callback = self.progress_callback
+        board.scheduler = self.scheduler
+        board.cancel_token = self.cancel_token
+        self.mypy = board
+        SyncModule._session_depth += 1
+        return board
+
+    def _record_handshake(self, board):
+        board_id = board.board_id()
+        samples = SyncModule.handshake_stats.setdefault(board_id, deque(maxlen=50))
+        samples.append(board.handshake_time)
+        self.do_progress(0, f"Raw REPL ready in {board.handshake_time * 1000:.0f} ms ({board_id})")
+
+    @staticmethod
+    def handshake_report():
+        """{board_id: (count, average ms, min ms, max ms)} of the recent raw REPL handshakes."""
+        report = {}
+        for board_id, samples in SyncModule.handshake_stats.items():
+            if samples:
+                ms = [t * 1000 for t in samples]
+                report[board_id] = (len(ms), sum(ms) / len(ms), min(ms), max(ms))
+        return report
+
+    @staticmethod
+    def _cancel_idle_timer():
+        timer = SyncModule._session_timer
+        SyncModule._session_timer = None
+        if timer is not None:
+            timer.cancel()
+
+    @staticmethod
+    def _schedule_idle_close():
+        SyncModule._cancel_idle_timer()
+        if SyncModule.idle_timeout is None or SyncModule.idle_timeout <= 0:
+            SyncModule._close_session()
+            return
+        timer = threading.Timer(SyncModule.idle_timeout, SyncModule.release_idle_session)
+        timer.daemon = True
+        SyncModule._session_timer = timer
+        timer.start()
+
+    @staticmethod
+    def _close_session():
+        SyncModule._cancel_idle_timer()
+        board = SyncModule._session_board
+        generation = SyncModule._session_generation
+        SyncModule._session_board = None
+        SyncModule._session_generation = None
+        SyncModule._session_depth = 0
+        if board is None:
+            return
+        if board.caps is not None:
+            SyncModule._board_caps = {generation: board.caps}
+        if generation == share_serial.SerialPortManager.generation():
+            try:
+                board.exit_raw_repl()
+            except Exception:
+                pass
+        share_serial.SerialPortManager().release_exclusive(generation)
+
+    @staticmethod
+    def release_idle_session():
+        """Hand the port back to the terminal if no operation is in progress."""
+        if not SyncModule._session_lock.acquire(blocking=False):
+            return
+        try:
+            if SyncModule._session_depth == 0:
+                SyncModule._close_session()
+        finally:
+            SyncModule._session_lock.release()
+
+    # ─────────────────────────────────────────────────────────────
+    #  Actions
+    # ─────────────────────────────────────────────────────────────
+
+    def check_cancelled(self):
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            raise mypyboard.PyboardCancelled("cancelled")
+
+    def manifest(self):
+        return manifest.Manifest(self.sharedserial.port_name())
+
+    def journal(self):
+        return journal.TransferJournal()
+
+    def put(self, board, src, dest):
+        """fs_put that can be resumed: larger uploads are journalled, and one
+        that broke off continues from the part the board verifiably has.
+        A large file the board already has a version of goes up as a delta
+        (only the changed blocks, see Pyboard.fs_put)."""
+        size = os.path.getsize(src)
+        files = self.journal()
+        if size < files.min_size:
+            return board.fs_put(src, dest)
+
+        digest = manifest.Manifest.local_hash(src)
+        offset = 0
+        entry = files.entry("put", dest)
+        if (entry is not None and entry["local"] == os.path.abspath(src)
+                and entry["size"] == size and entry["hash"] == digest):
+            remote_size, _, n, remote_digest = manifest.Manifest.remote_prefix(board, dest, entry["offset"])
+            if (remote_size is not None and remote_size <= size and remote_digest is not None
+                    and remote_digest == manifest.file_hash(src, remote_digest.split(":")[0], n)):
+                offset = n
+                self.do_progress(100.0 * n / size, f"Resuming upload of {dest} at {n}/{size}")
 
-    def sync_file(self, filename):
+        commit = files.start("put", src, dest, size, digest, self.sharedserial.port_name(), offset)
+        try:
+            result = board.fs_put(src, dest, offset=offset, committed=commit)
+        except mypyboard.PyboardCancelled:
+            # Cancelled on purpose, the partial file is gone
+            files.finish("put", dest)
+            raise
+        files.finish("put", dest)
+        return result
+
+    def get(self, board, src, dest):
+        """fs_get that can be resumed, see put()."""
+        remote_size, mtime, _, _ = manifest.Manifest.remote_prefix(board, src, 0)
+        files = self.journal()
+        if remote_size is None or remote_size < files.min_size:
+            return board.fs_get(src, dest)
+
+        identity = f"mtime:{mtime}"
+        offset = 0
+        entry = files.entry("get", src)
+        if (entry is not None and entry["local"] == os.path.abspath(dest) and os.path.exists(dest)
+                and entry["size"] == remote_size and entry["hash"] == identity):
+            length = min(os.path.getsize(dest), entry["offset"])
+            _, _, n, remote_digest = manifest.Manifest.remote_prefix(board, src, length)
+            if remote_digest is not None and remote_digest == manifest.file_hash(dest, remote_digest.split(":")[0], n):
+                offset = n
+                self.do_progress(100.0 * n / remote_size, f"Resuming download of {src} at {n}/{remote_size}")
+
+        commit = files.start("get", dest, src, remote_size, identity, self.sharedserial.port_name(), offset)
+        try:
+            result = board.fs_get(src, dest, progress_callback=lambda position, size: commit(position), offset=offset)
+        except mypyboard.PyboardCancelled:
+            files.finish("get", src)
+            raise
+        files.finish("get", src)
+        return result
+
+    def resume_transfers(self):
+        """Finish the journalled transfers that broke off. Returns the remote paths done."""
+        done = []
+        with self.session() as board:
+            for entry in self.journal().pending():
+                self.check_cancelled()
+                if entry["direction"] == "put":
+                    if not os.path.exists(entry["local"]):
+                        self.journal().finish("put", entry["remote"])
+                        continue
+                    self.manifest().forget(entry["remote"])
+                    self.put(board, entry["local"], entry["remote"])
+                    self.manifest().remember_upload(entry["local"], entry["remote"])
+                else:
+                    self.get(board, entry["remote"], entry["local"])
+                done.append(entry["remote"])
+        return done
+
+    def sync_file(self, filename, soft_reset=False, force=False, remote=None):
+        """
+        Upload filename to the working directory, unless the board already has it. Returns True if uploaded.
+        remote is the path below the working directory (default: the file name); missing directories are created.
+        """
         if not self.getmypy():
             raise Exception("Cannot access serial port. It is not open.")
 
         self.do_progress(1, f"Syncing {filename}")
         print("Syncing file " + filename)
 
-        with self.sharedserial.exclusive_port() as port:
-            self.mypy = mypyboard.Pyboard("serial", port, self.progress_callback)
-            self.mypy.enter_raw_repl()
-            self.mypy.fs_put(filename, self.ffn(os.path.basename(filename)))
-            self.mypy.exit_raw_repl()
+        remote = remote or os.path.basename(filename)
+        dest = self.ffn(remote)
+        files = self.manifest()
+        with self.session(soft_reset) as board:
+            status = None if force else files.compare(board, [(filename, dest)])[dest]
+            if status == "same":
+                self.do_progress(100, f"{filename} is up to date")
+                return False
+            if status in (None, "new") and "/" in remote:
+                parts = remote.split("/")[:-1]
+                parents = [self.ffn("/".join(parts[:i])) for i in range(1, len(parts) + 1)]
+                board.exec_("import uos\nfor d in %r:\n try:uos.mkdir(d)\n except OSError:pass" % parents)
+            files.forget(dest)
+            self.put(board, filename, dest)
+            files.remember_upload(filename, dest)
 
         self.do_progress(100, f"Syncing {filename} complete")
+        return True
 
+    def sync_project(self, folder, force=False, soft_reset=False):
+        """
+        Upload every changed file below folder to the working directory, in one
+        raw REPL session. Unchanged files (by size and hash) and ignored files
+        (see DEFAULT_IGNORE, .syncignore) are skipped, missing remote directories
+        are created. Returns (uploaded, skipped) lists of relative paths.
 
-    def sync_action(self, action, src="", dest="", filenames=[]):
+        With bundle_deploy the changed files below the journal's size limit go
+        up as one bundle, unpacked by a single exec on the board; bigger ones
+        are uploaded one by one (and can be resumed).
+        """
+        if not self.getmypy():
+            raise Exception("Cannot access serial port. It is not open.")
+
+        self.do_progress(0, f"Syncing project {folder}")
+        files = project_files(folder)
+        pairs = [(path, self.ffn(rel)) for path, rel in files]
+        rel_of = {self.ffn(rel): rel for _, rel in files}
+        files_manifest = self.manifest()
+
+        with self.session(soft_reset) as board:
+            if force:
+                changed = pairs
+            else:
+                status = files_manifest.compare(board, pairs, root=SyncModule.workdir, deep=True)
+                changed = [(path, dest) for path, dest in pairs if status[dest] != "same"]
+            changed_dests = {dest for _, dest in changed}
+            skipped = [rel_of[dest] for _, dest in pairs if dest not in changed_dests]
+
+            bundle = []
+            if SyncModule.bundle_deploy and board.probe_caps().get("stdin_buffer"):
+                bundle = [(path, dest) for path, dest in changed if os.path.getsize(path) < self.journal().min_size]
+                if len(bundle) < 2:
+                    bundle = []
+            single = [(path, dest) for path, dest in changed if (path, dest) not in bundle]
+
+            # Parents first, and only the ones the board doesn't have yet.
+            # (The bundle unpacker creates its own.)
+            remote_dirs = {p for p, (size, _) in files_manifest.last_remote.items() if size == -1}
+            needed = set()
+            for _, dest in single:
+                rel = rel_of[dest]
+                parts = rel.split("/")[:-1]
+                for i in range(1, len(parts) + 1):
+                    needed.add(self.ffn("/".join(parts[:i])))
+            for remote_dir in sorted(needed - remote_dirs, key=lambda d: d.count("/")):
+                board.fs_mkdir(remote_dir)
+
+            total = sum(os.path.getsize(path) for path, _ in changed) or 1
+            done = 0
+            uploaded = []
+            failed = {}
+            if bundle:
+                size = sum(os.path.getsize(path) for path, _ in bundle)
+                board.progress_callback = lambda p, status: self.do_progress(
+                    100.0 * size * p / 100.0 / total, f"Bundle: {status}")
+                for path, dest in bundle:
+                    files_manifest.forget(dest)
+                try:
+                    results = board.fs_put_bundle(bundle)
+                finally:
+                    board.progress_callback = self.progress_callback
+                for path, dest in bundle:
+                    if dest not in results:
+                        continue
+                    if results[dest] is None:
+                        files_manifest.remember_upload(path, dest)
+                        uploaded.append(rel_of[dest])
+                    else:
+                        failed[rel_of[dest]] = results[dest]
+                done += size
+
+            for path, dest in single:
+                self.check_cancelled()
+                size = os.path.getsize(path)
+                board.progress_callback = lambda p, status, done=done, size=size: self.do_progress(
+                    100.0 * (done + size * p / 100.0) / total, f"{rel_of[dest]}: {status}")
+                try:
+                    files_manifest.forget(dest)
+                    self.put(board, path, dest)
+                finally:
+                    board.progress_callback = self.progress_callback
+                files_manifest.remember_upload(path, dest)
+                uploaded.append(rel_of[dest])
+                done += size
+
+        if failed:
+            summary = ", ".join(f"{rel}: {error}" for rel, error in sorted(failed.items()))
+            self.do_progress(100, f"Project sync: {len(uploaded)} uploaded, {len(failed)} failed")
+            raise mypyboard.PyboardError(f"{len(failed)} file(s) failed: {summary}")
+        self.do_progress(100, f"Project synced: {len(uploaded)} uploaded, {len(skipped)} unchanged")
+        return uploaded, skipped
+
+    def remote_diff(self, folder):
+        """
+        Compare the project files below folder with the working directory on the
+        board, recursively and by size and hash only, the way sync_project sees
+        them (ignored files left out). Returns [(status, path)], status being one of
+        'new', 'changed', 'same' (local files) or 'remote' (only on the board).
+        """
+        patterns = load_ignore_patterns(folder)
+        pairs = [(path, self.ffn(rel)) for path, rel in project_files(folder, patterns)]
+
+        with self.session() as board:
+            status = self.manifest().compare(board, pairs, root=SyncModule.workdir, deep=True)
+
+        prefix = self.ffn("")
+        result = []
+        for name, state in status.items():
+            rel = name[len(prefix):] if name.startswith(prefix) else name
+            if state == "remote" and is_ignored(rel, False, patterns):
+                continue
+            result.append((state, rel))
+        return sorted(result)
+
+
+    def sync_action(self, action, src="", dest="", filenames=[], soft_reset=False):
         result = None
         if not self.getmypy():
             raise Exception("Cannot access serial port. It is not open.")
 
         print(f"Performing action {action} on file {src}")
 
-        with self.sharedserial.exclusive_port() as port:
-            self.mypy = mypyboard.Pyboard("serial", port, self.progress_callback)
-
-            self.mypy.enter_raw_repl()
+        with self.session(soft_reset) as board:
             if action == 'pwd':
-                result = self.mypy.fs_pwd()
+                result = board.fs_pwd()
             if action == 'ls':
-                result = self.mypy.fs_ls()
+                result = board.fs_ls()
             if action == 'dir':
-                result = self.mypy.fs_listdir(src)
+                result = board.fs_listdir(src)
             if action == 'cat':
-                result = self.mypy.fs_cat(self.ffn(src))
+                result = board.fs_cat(self.ffn(src))
             if action == 'get':
-                result = self.mypy.fs_get(self.ffn(src), dest)
+                result = self.get(board, self.ffn(src), dest)
             if action == 'put':
-                result = self.mypy.fs_put(src, self.ffn(dest))
+                self.manifest().forget(self.ffn(dest))
+                result = self.put(board, src, self.ffn(dest))
+                self.manifest().remember_upload(src, self.ffn(dest))
             if action == 'mkdir':
-                result = self.mypy.fs_mkdir(src)
+                result = board.fs_mkdir(src)
             if action == 'rmdir':
-                result = self.mypy.fs_rmdir(src)
+                result = board.fs_rmdir(src)
             if action == 'rm':
-                result = self.mypy.fs_rm(src)
+                self.manifest().forget(self.ffn(src))
+                result = board.fs_rm(self.ffn(src))
             if action == 'stat':
-                result = self.mypy.fs_stat(self.ffn(src))
+                result = board.fs_stat(self.ffn(src))
             if action == 'view':
-                result = self.mypy.fs_readfile(self.ffn(src))
+                result = board.fs_readfile(self.ffn(src))
             if action == 'cp':
-                result = self.mypy.fs_cp(self.ffn(src), self.ffn(dest))
+                self.manifest().forget(self.ffn(dest))
+                result = board.fs_cp(self.ffn(src), self.ffn(dest))
             if action == 'touch':
-                result = self.mypy.fs_touch(self.ffn(src))
+                self.manifest().forget(self.ffn(src))
+                result = board.fs_touch(self.ffn(src))
             if action == 'mv':
-                result = self.mypy.fs_cp(self.ffn(src), self.ffn(dest))
+                self.manifest().forget(self.ffn(src))
+                self.manifest().forget(self.ffn(dest))
+                result = board.fs_cp(self.ffn(src), self.ffn(dest))
             if action == 'exec':
                 buffer = bytearray()
 
                 def dataconsumer(data):
                     buffer.extend(data.replace(b"\x04", b""))
 
-                _ = self.mypy.exec_(src, dataconsumer)
+                _ = board.exec_(src, dataconsumer)
                 result = buffer.decode()
 
-            self.mypy.exit_raw_repl()
-
         return result
@@ -1,4 +1,8 @@
+import codecs
+import time
 import tkinter as tk
+import tkinter.font as tkfont
+from . import scrollback
 from . import share_serial
 import pyte
 
@@ -12,18 +16,69 @@ import pyte
 #   - Arrow keys via keysym, no magic keycodes.
 
 
+# Tk colours for pyte's colour names (xterm's palette); 256-colour and
+# true colour attributes come as hex strings. pyte spells one of them wrong.
+COLOURS = {
+    "black": "#000000", "red": "#cd0000", "green": "#00cd00", "brown": "#cdcd00",
+    "blue": "#0000ee", "magenta": "#cd00cd", "cyan": "#00cdcd", "white": "#e5e5e5",
+    "brightblack": "#7f7f7f", "brightred": "#ff0000", "brightgreen": "#00ff00", "brightbrown": "#ffff00",
+    "brightblue": "#5c5cff", "brightmagenta": "#ff00ff", "bfightmagenta": "#ff00ff", "brightcyan": "#00ffff",
+    "brightwhite": "#ffffff",
+}
+DEFAULT_STYLE = ("default", "default", False)  # fg, bg, reverse
+
+
 class TerminalWindow:
-    def __init__(self, master=None):
+    # Renders are coalesced: soon after a keystroke echo, less often while the board floods us
+    render_interval_min = 10  # ms
+    render_interval_max = 100  # ms
+    # Input rate (bytes/s) at which the render interval reaches its maximum
+    busy_rate = 20000
+    # Above this input rate (bytes/s) the terminal goes into storm mode: it still parses
+    # everything as it comes in, but only draws storm_fps frames a second
+    storm_rate = 50000
+    storm_fps = 4
+    # Memory for the lines that scrolled off the screen, see scrollback.py
+    scrollback_bytes = 16 << 20
+    # The screen follows the widget size, once it stopped changing for this long
+    resize_delay_ms = 150
+    min_columns = 20
+    min_lines = 5
+
+    def __init__(self, master=None, scrollback_bytes=None):
         self.master = master
         self.local_echo = False  # Local echo flag. Set to True to enable local echo.
         self.serial = share_serial.SerialPortManager()
-        self.serial.subscribe(self.receive_data)
+        # Fed on the Tk thread, in time-sliced batches. Nothing is dropped: should the
+        # terminal ever fall a megabyte behind, the reader thread waits for it.
+        self.subscription = self.serial.subscribe(self.receive_data, policy="block", max_bytes=1 << 20, tk_widget=master)
 
         self.waiting_for_escape = False
         self.render_scheduled = False
 
+        # Input rate and frame timing, for the adaptive render interval and render_stats()
+        self.input_rate = 0.0
+        self._rx_bytes = 0
+        self._last_frame_at = time.monotonic()
+        self._frame_ms = 0.0
+        self._stats = {"frames": 0, "full_frames": 0, "lines": 0, "total_ms": 0.0, "max_ms": 0.0, "storms": 0}
+        self.storm = False
+
+        # Lines the view is scrolled back into the history, 0 follows the screen. Only the
+        # lines in view are in the Text widget, the scrollbar is ours (see _on_scrollbar).
+        self.scroll_offset = 0
+        self._view_stale = True
+        self._history_total = 0
+
+        # Colour tags configured so far, and the pending resize
+        self._style_tags = {}
+        self._resize_job = None
+
+        # Bytes to text; keeps the start of a UTF-8 character that was split across reads
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
         # Pyte integration
-        self.screen = pyte.Screen(80, 35)
+        self.screen = scrollback.ScrollbackScreen(80, 35, scrollback_bytes or self.scrollback_bytes)
         self.stream = pyte.Stream()
         self.stream.attach(self.screen)
 
@@ -46,6 +101,9 @@ class TerminalWindow:
         )
         self.text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
+        # Shown over the top right corner of the terminal while in storm mode
+        self.storm_label = tk.Label(self.text_widget, bg="orange", fg="black")
+
         # Create a vertical Scrollbar widget inside the container frame
         self.scrollbar = tk.Scrollbar(self.container_frame)
         self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -55,11 +113,11 @@ class TerminalWindow:
         self.h_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
 
         # Configure the Text widget to work with the Scrollbars
+        # The vertical one scrolls through the history, the Text itself only ever holds a screenful
         self.text_widget.config(
-            yscrollcommand=self.scrollbar.set,
             xscrollcommand=self.h_scrollbar.set,
         )
-        self.scrollbar.config(command=self.text_widget.yview)
+        self.scrollbar.config(command=self._on_scrollbar)
         self.h_scrollbar.config(command=self.text_widget.xview)
 
         # Keyboard bindings
@@ -76,6 +134,14 @@ class TerminalWindow:
         self.text_widget.bind("<Button-3>", self._show_context_menu)
         self.text_widget.bind("<Button-2>", self._show_context_menu)
 
+        # Resize the pyte screen along with the widget
+        self.text_widget.bind("<Configure>", self._on_configure)
+
+        # Mouse wheel scrolls the history (<Button-4/5> on X11)
+        self.text_widget.bind("<MouseWheel>", self._on_mousewheel)
+        self.text_widget.bind("<Button-4>", self._on_mousewheel)
+        self.text_widget.bind("<Button-5>", self._on_mousewheel)
+
         self._create_context_menu()
 
     def _create_context_menu(self):
@@ -118,36 +184,250 @@ class TerminalWindow:
     # ─────────────────────────────────────────────────────────────
 
     def _handle_received_data(self, data):
-        # Convert data to a string if it is not already
-        if not isinstance(data, str):
-            data = "".join(
-                chr(element) if isinstance(element, int) else element for element in data
-            )
-
         # Feed the incoming serial data to Pyte's Stream
+        self._rx_bytes += len(data)
+        if not isinstance(data, str):
+            data = self._decoder.decode(data)
         self.stream.feed(data)
 
         # Schedule render (coalesced)
         if not self.render_scheduled:
-            self.master.after(50, self._render_screen)
+            self.master.after(self.render_interval(), self._render_screen)
             self.render_scheduled = True
 
+    def render_interval(self):
+        """Milliseconds to wait before the next render, from the input rate and what rendering costs."""
+        if self.storm:
+            return int(1000 / self.storm_fps)
+        busy = min(1.0, self.input_rate / self.busy_rate)
+        interval = self.render_interval_min + busy * (self.render_interval_max - self.render_interval_min)
+        # Never spend more than about a fifth of the time rendering
+        return int(min(self.render_interval_max, max(interval, 4 * self._frame_ms)))
+
     def _render_screen(self):
         self.render_scheduled = False
-
-        # Clear the Text widget
-        self.text_widget.delete("1.0", tk.END)
-
-        # Update the UI based on Pyte's Screen state
-        for line in self.screen.display:
-            self.text_widget.insert(tk.END, line + "\n")
-
-        # Handle cursor positioning
-        cursor_position = f"{self.screen.cursor.y + 1}.{self.screen.cursor.x}"
-        self.text_widget.mark_set(tk.INSERT, cursor_position)
+        start = time.monotonic()
+        elapsed = start - self._last_frame_at
+        if elapsed > 0:
+            self.input_rate = 0.5 * self.input_rate + 0.5 * self._rx_bytes / elapsed
+        self._rx_bytes = 0
+        self._last_frame_at = start
+        # Into storm mode above storm_rate, out again once below half of it
+        storm = self.input_rate > (self.storm_rate / 2 if self.storm else self.storm_rate)
+        if storm or self.storm:
+            self._show_storm(storm)
+
+        screen = self.screen
+        history = screen.scrollback
+        # A view scrolled back stays on the same lines while new ones scroll off the screen
+        added = history.total - self._history_total
+        self._history_total = history.total
+        if self.scroll_offset and added:
+            offset = min(self.scroll_offset + added, len(history))
+            if offset != self.scroll_offset + added:
+                self._view_stale = True  # the lines in view were dropped from the history
+            self.scroll_offset = offset
+
+        # The widget holds one line per screen line plus the trailing newline; if that
+        # doesn't hold (first render, text inserted from elsewhere) redraw everything
+        full = self._view_stale or int(self.text_widget.index("end-1c").split(".")[0]) != screen.lines + 1
+        rendered = 0
+        runs = {}  # style -> index pairs of the runs of that style, tagged in one go below
+        if self.scroll_offset:
+            # Scrolled back: a screenful of history, possibly followed by the top of the screen
+            top = len(history) - self.scroll_offset
+            live = screen.lines - self.scroll_offset
+            if full or (live > 0 and screen.dirty):
+                window = history.lines(top, top + screen.lines)
+                window.extend(self._styled_line(y, self.scroll_offset + y + 1, runs) for y in range(max(0, live)))
+                self.text_widget.delete("1.0", tk.END)
+                self.text_widget.insert(tk.END, "".join(line + "\n" for line in window))
+                rendered = screen.lines
+        elif full:
+            self.text_widget.delete("1.0", tk.END)
+            self.text_widget.insert(tk.END, "".join(self._styled_line(y, y + 1, runs) + "\n" for y in range(screen.lines)))
+            rendered = screen.lines
+        else:
+            # Only the lines pyte marked as changed, consecutive ones replaced in one go
+            dirty = sorted(y for y in screen.dirty if y < screen.lines)
+            i = 0
+            while i < len(dirty):
+                first = last = dirty[i]
+                i += 1
+                while i < len(dirty) and dirty[i] == last + 1:
+                    last = dirty[i]
+                    i += 1
+                text = "\n".join(self._styled_line(y, y + 1, runs) for y in range(first, last + 1))
+                self.text_widget.delete(f"{first + 1}.0", f"{last + 1}.end")
+                self.text_widget.insert(f"{first + 1}.0", text)
+                rendered += last - first + 1
+        for style, indices in runs.items():
+            self.text_widget.tag_add(self._style_tag(style), *indices)
+        screen.dirty.clear()
+        self._view_stale = False
+
+        if not self.scroll_offset:
+            # Handle cursor positioning
+            cursor_position = f"{screen.cursor.y + 1}.{screen.cursor.x}"
+            self.text_widget.mark_set(tk.INSERT, cursor_position)
 
         # Scroll to the end
         self.text_widget.see(tk.END)
+        self._update_scrollbar()
+        if self.storm and not self.render_scheduled:
+            # Keep measuring, or the storm indicator stays up after the output stopped
+            self.master.after(self.render_interval(), self._render_screen)
+            self.render_scheduled = True
+
+        ms = (time.monotonic() - start) * 1000
+        self._frame_ms = ms
+        st = self._stats
+        st["frames"] += 1
+        st["full_frames"] += full
+        st["lines"] += rendered
+        st["total_ms"] += ms
+        st["max_ms"] = max(st["max_ms"], ms)
+
+    def _styled_line(self, y, row, runs):
+        # Text of screen line y, shown in row of the widget. Every run of cells in
+        # the same non-default colours adds one index pair to runs.
+        line = self.screen.buffer[y]
+        chars = []
+        col = start = 0
+        style = DEFAULT_STYLE
+        for x in range(self.screen.columns):
+            char = line[x]
+            cell = (char.fg, char.bg, char.reverse)
+            if cell != style:
+                if style != DEFAULT_STYLE and col > start:
+                    runs.setdefault(style, []).extend((f"{row}.{start}", f"{row}.{col}"))
+                style = cell
+                start = col
+            chars.append(char.data)
+            col += len(char.data)
+        if style != DEFAULT_STYLE and col > start:
+            runs.setdefault(style, []).extend((f"{row}.{start}", f"{row}.{col}"))
+        return "".join(chars)
+
+    def _style_tag(self, style):
+        tag = self._style_tags.get(style)
+        if tag is None:
+            fg, bg, reverse = style
+            fg = self._colour(fg, "foreground")
+            bg = self._colour(bg, "background")
+            if reverse:
+                fg, bg = bg, fg
+            tag = f"sgr{len(self._style_tags)}"
+            self.text_widget.tag_configure(tag, foreground=fg, background=bg)
+            # Keep the selection visible on coloured text
+            self.text_widget.tag_raise(tk.SEL)
+            self._style_tags[style] = tag
+        return tag
+
+    def _colour(self, name, default_option):
+        if name in COLOURS:
+            return COLOURS[name]
+        if len(name) == 6:
+            try:
+                int(name, 16)
+                return "#" + name
+            except ValueError:
+                pass
+        return self.text_widget.cget(default_option)
+
+    def _show_storm(self, storm):
+        if storm:
+            if not self.storm:
+                self._stats["storms"] += 1
+                self.storm_label.place(relx=1.0, y=0, anchor="ne")
+            self.storm_label.config(text=f"Output storm: {self.input_rate / 1024:.0f} KB/s, "
+                                         f"showing {self.storm_fps} frames/s")
+        else:
+            self.storm_label.place_forget()
+        self.storm = storm
+
+    # ── following the widget size ──────────────────────────────
+
+    def _on_configure(self, event):
+        # Dragging a pane fires this for every pixel; act once it settled
+        if self._resize_job is not None:
+            self.text_widget.after_cancel(self._resize_job)
+        self._resize_job = self.text_widget.after(self.resize_delay_ms, self._apply_size, event.width, event.height)
+
+    def _apply_size(self, width, height):
+        self._resize_job = None
+        font = tkfont.Font(font=self.text_widget.cget("font"))
+        border = 2 * (int(self.text_widget.cget("borderwidth")) + int(self.text_widget.cget("highlightthickness")))
+        columns = (width - border - 2 * int(self.text_widget.cget("padx"))) // max(1, font.measure("0"))
+        lines = (height - border - 2 * int(self.text_widget.cget("pady"))) // max(1, font.metrics("linespace"))
+        columns = max(self.min_columns, columns)
+        lines = max(self.min_lines, lines)
+        if (lines, columns) != (self.screen.lines, self.screen.columns):
+            self.screen.resize(lines, columns)
+            self._view_stale = True
+            self._render_screen()
+
+    # ── scrolling through the history ──────────────────────────
+
+    def _update_scrollbar(self):
+        total = len(self.screen.scrollback) + self.screen.lines
+        top = len(self.screen.scrollback) - self.scroll_offset
+        self.scrollbar.set(top / total, (top + self.screen.lines) / total)
+
+    def _on_scrollbar(self, *args):
+        # Scrollbar command: ("moveto", fraction) or ("scroll", n, "units" or "pages")
+        history = len(self.screen.scrollback)
+        if args[0] == "moveto":
+            offset = history - int(float(args[1]) * (history + self.screen.lines))
+        elif args[0] == "scroll":
+            n = int(args[1])
+            if args[2] == "pages":
+                n *= self.screen.lines
+            offset = self.scroll_offset - n
+        else:
+            return
+        self.scroll_to(offset)
+
+    def _on_mousewheel(self, event):
+        up = event.num == 4 or (event.num != 5 and event.delta > 0)
+        self._on_scrollbar("scroll", -3 if up else 3, "units")
+        return "break"
+
+    def scroll_to(self, offset):
+        """Show the screenful offset lines back in the history, 0 to follow the screen again."""
+        offset = max(0, min(offset, len(self.screen.scrollback)))
+        if offset != self.scroll_offset:
+            self.scroll_offset = offset
+            self._view_stale = True
+            self._render_screen()
+
+    def render_stats(self):
+        """Frames rendered (and how many of them full redraws), lines drawn, frame time, the current interval and the history kept."""
+        st = self._stats
+        return {
+            "frames": st["frames"],
+            "full_frames": st["full_frames"],
+            "lines": st["lines"],
+            "avg_ms": st["total_ms"] / st["frames"] if st["frames"] else 0.0,
+            "max_ms": st["max_ms"],
+            "interval_ms": self.render_interval(),
+            "input_rate": self.input_rate,
+            "history_lines": len(self.screen.scrollback),
+            "history_bytes": self.screen.scrollback.nbytes,
+            "storm": self.storm,
+            "storms": st["storms"],
+        }
+
+    def replay(self, data, chunk_size=1024):
+        """
+        Benchmark: feed a recorded capture (bytes) in chunks of chunk_size,
+        rendering after each one, and return render_stats() of the run.
+        """
+        self._stats = {"frames": 0, "full_frames": 0, "lines": 0, "total_ms": 0.0, "max_ms": 0.0, "storms": 0}
+        for i in range(0, len(data), chunk_size):
+            self.stream.feed(self._decoder.decode(data[i:i + chunk_size]))
+            self._render_screen()
+        return self.render_stats()
 
     # ─────────────────────────────────────────────────────────────
     #  KEYBOARD → SERIAL (SEND PATH)
@@ -272,6 +552,9 @@ class TerminalWindow:
         return "break"
 
     def _send_data(self, data: bytes):
+        # Typing brings the view back to the screen
+        if self.scroll_offset:
+            self.scroll_to(0)
         self.serial.send_data(data)
 
 
@@ -280,7 +563,7 @@ class TerminalWindow:
     # ─────────────────────────────────────────────────────────────
 
     def receive_data(self, data):
-        """Called externally when data is received from serial."""
+        """Called with data received from serial, on the Tk thread (see _Subscription)."""
         self._handle_received_data(data)
 
     def _update_status(self, message):